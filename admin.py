@@ -1,13 +1,20 @@
-# pylint: disable=no-member, too-few-public-methods
+# pylint: disable=no-member, too-few-public-methods, line-too-long
 
 from django.contrib import admin
+from django.utils import timezone
 
-from .models import ReportJob, ReportDestination, ReportJobBatchRequest
+from .models import ReportCursor, ReportJob, ReportJobArchive, ReportDestination, ReportJobBatchRequest, ReportSchedule, ReportTransmission
 
 def reset_report_jobs(modeladmin, request, queryset): # pylint: disable=unused-argument
     for job in queryset:
         job.started = None
         job.completed = None
+        job.failed = None
+        job.claim_token = None
+        job.claim_count = 0
+        job.lease_expires = None
+        job.heartbeat = None
+        job.report_size = None
 
         if job.report is not None:
             job.report.delete()
@@ -25,10 +32,13 @@ class ReportJobAdmin(admin.ModelAdmin):
         'job_index',
         'job_count',
         'started',
-        'completed'
+        'heartbeat',
+        'completed',
+        'failed',
+        'report_size'
     )
 
-    list_filter = ('requested', 'started', 'completed',)
+    list_filter = ('requested', 'started', 'completed', 'failed',)
 
     actions = [reset_report_jobs]
     search_fields = ('parameters',)
@@ -42,3 +52,46 @@ class ReportJobBatchRequestAdmin(admin.ModelAdmin):
 class ReportDestinationAdmin(admin.ModelAdmin):
     list_display = ('user', 'destination', 'description')
     search_fields = ('destination', 'user',)
+
+def retry_report_transmissions(modeladmin, request, queryset): # pylint: disable=unused-argument
+    queryset.filter(transmitted=None).update(failed=None, next_attempt=timezone.now())
+
+retry_report_transmissions.description = 'Retry report transmissions'
+
+@admin.register(ReportTransmission)
+class ReportTransmissionAdmin(admin.ModelAdmin):
+    list_display = (
+        'job',
+        'destination',
+        'created',
+        'attempts',
+        'last_attempt',
+        'next_attempt',
+        'transmitted',
+        'failed'
+    )
+
+    list_filter = ('created', 'next_attempt', 'transmitted', 'failed',)
+
+    actions = [retry_report_transmissions]
+    search_fields = ('last_error',)
+
+@admin.register(ReportCursor)
+class ReportCursorAdmin(admin.ModelAdmin):
+    list_display = ('requester', 'data_source', 'data_type', 'high_water', 'updated')
+    list_filter = ('high_water', 'updated', 'data_type', 'requester')
+    search_fields = ('data_source', 'data_type',)
+
+@admin.register(ReportSchedule)
+class ReportScheduleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'requester', 'schedule', 'active', 'incremental', 'last_run', 'next_run')
+    list_filter = ('active', 'incremental', 'last_run', 'next_run', 'requester')
+    search_fields = ('name', 'schedule', 'data_sources', 'data_types',)
+    filter_horizontal = ('destinations',)
+    readonly_fields = ('last_run', 'last_batch',)
+
+@admin.register(ReportJobArchive)
+class ReportJobArchiveAdmin(admin.ModelAdmin):
+    list_display = ('job_id', 'requester', 'requested', 'completed', 'failed', 'data_source_count', 'report_size', 'archived')
+    list_filter = ('requested', 'completed', 'failed', 'archived', 'requester')
+    search_fields = ('data_types', 'report_name',)
@@ -0,0 +1,126 @@
+# pylint: disable=line-too-long
+
+import io
+import struct
+import sys
+import threading
+import zipfile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+LOCAL_FILE_HEADER_FORMAT = '<4s2B4HL2L2H'
+LOCAL_FILE_HEADER_SIZE = struct.calcsize(LOCAL_FILE_HEADER_FORMAT)
+LOCAL_FILE_HEADER_SIGNATURE = b'PK\003\004'
+
+MASK_USE_DATA_DESCRIPTOR = 0x08
+
+BadZipFile = getattr(zipfile, 'BadZipFile', None) or zipfile.BadZipfile # Python 2 only has BadZipfile.
+
+COMPRESSION_TYPES = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+
+if hasattr(zipfile, 'ZIP_BZIP2'): # Python 3.3+
+    COMPRESSION_TYPES['bzip2'] = zipfile.ZIP_BZIP2
+
+if hasattr(zipfile, 'ZIP_LZMA'): # Python 3.3+
+    COMPRESSION_TYPES['lzma'] = zipfile.ZIP_LZMA
+
+# ZipFile.write accepts compresslevel on Python 3.7+. Earlier versions use the library defaults.
+
+SUPPORTS_COMPRESSION_LEVEL = sys.version_info >= (3, 7)
+
+def fetch_compression(compression=None, level=None):
+    if compression is None:
+        compression = 'deflate'
+
+    if isinstance(compression, dict):
+        level = compression.get('level', level)
+        compression = compression.get('compression', 'deflate')
+
+    if (compression in COMPRESSION_TYPES) is False:
+        raise ValueError('Unknown report compression "%s". Use one of: %s.' % (compression, ', '.join(sorted(COMPRESSION_TYPES.keys()))))
+
+    compress_type = COMPRESSION_TYPES[compression]
+
+    if compress_type in (zipfile.ZIP_STORED, getattr(zipfile, 'ZIP_LZMA', None)):
+        level = None # Not configurable.
+    elif level is not None:
+        level = int(level)
+
+        if level < 1 or level > 9:
+            raise ValueError('Report compression level must be between 1 and 9 (got %s).' % level)
+
+        if SUPPORTS_COMPRESSION_LEVEL is False:
+            level = None
+
+    return (compress_type, level)
+
+class ReportZipFile(zipfile.ZipFile):
+    # Adds raw member copies to zipfile.ZipFile. Bookkeeping mirrors ZipFile.mkdir & ZipFile.write.
+
+    def copy_member(self, source_file, source_info):
+        if not self.fp:
+            raise ValueError('Attempt to write to ZIP archive that was already closed')
+
+        if getattr(self, '_writing', False):
+            raise ValueError('Can\'t write to ZIP archive while an open writing handle exists')
+
+        source_file.seek(source_info.header_offset)
+
+        header = struct.unpack(LOCAL_FILE_HEADER_FORMAT, source_file.read(LOCAL_FILE_HEADER_SIZE))
+
+        if header[0] != LOCAL_FILE_HEADER_SIGNATURE:
+            raise BadZipFile('Bad magic number for file header (%s)' % source_info.filename)
+
+        source_file.seek(header[10] + header[11], io.SEEK_CUR) # Skip file name & extra field.
+
+        zinfo = zipfile.ZipInfo(source_info.filename, source_info.date_time)
+        zinfo.compress_type = source_info.compress_type
+        zinfo.comment = source_info.comment
+        zinfo.create_system = source_info.create_system
+        zinfo.external_attr = source_info.external_attr
+        zinfo.CRC = source_info.CRC
+        zinfo.compress_size = source_info.compress_size
+        zinfo.file_size = source_info.file_size
+
+        # Sizes & CRC are known up front, so the copy never needs a trailing data descriptor.
+
+        zinfo.flag_bits = source_info.flag_bits & ~MASK_USE_DATA_DESCRIPTOR
+
+        # Python 2's ZipFile has no write lock & always appends at the current position.
+
+        with getattr(self, '_lock', None) or threading.RLock():
+            if getattr(self, '_seekable', False):
+                self.fp.seek(self.start_dir)
+
+            zinfo.header_offset = self.fp.tell()
+
+            self._writecheck(zinfo)
+            self._didModify = True
+
+            self.fp.write(zinfo.FileHeader())
+
+            remaining = zinfo.compress_size
+
+            while remaining > 0:
+                chunk = source_file.read(min(COPY_CHUNK_SIZE, remaining))
+
+                if not chunk:
+                    raise BadZipFile('Truncated file data (%s)' % source_info.filename)
+
+                self.fp.write(chunk)
+
+                remaining -= len(chunk)
+
+            self.filelist.append(zinfo)
+            self.NameToInfo[zinfo.filename] = zinfo
+
+            self.start_dir = self.fp.tell()
+
+    def copy_members(self, zip_path):
+        with zipfile.ZipFile(zip_path, 'r') as source_zip:
+            with io.open(zip_path, 'rb') as source_file:
+                for source_info in source_zip.infolist():
+                    self.copy_member(source_file, source_info)
@@ -2,28 +2,58 @@ from __future__ import print_function
 
 import bz2
 import datetime
-import gc
 import io
 import logging
 import os
 import sys
 import tempfile
 
+import django
+
+from django.apps import apps
 from django.conf import settings
-from django.core import management
+from django.core import serializers
 from django.utils.text import slugify
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
+BACKUP_CHUNK_SIZE = 500
+
+class BZ2StreamWriter:
+    # Text stream for Django serializers that compresses output straight to a file as it is written.
+
+    def __init__(self, file_stream):
+        self.file_stream = file_stream
+        self.compressor = bz2.BZ2Compressor()
+
+    def write(self, text):
+        if isinstance(text, bytes) is False: # Python 2 serializers may also write encoded strings.
+            text = text.encode('utf-8')
+
+        compressed = self.compressor.compress(text)
+
+        if compressed:
+            self.file_stream.write(compressed)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.file_stream.write(self.compressor.flush())
+
 def incremental_backup(parameters):
     to_transmit = []
 
-    # Dump full content of these models. No incremental backup here.
+    # Models with a date field are limited to the backup window. Others are backed up in full.
 
     dumpdata_apps = (
-        'simple_data_export.ReportDestination',
-        'simple_data_export.ReportJob',
-        'simple_data_export.ReportJobBatchRequest',
+        ('simple_data_export.ReportDestination', None),
+        ('simple_data_export.ReportSchedule', None),
+        ('simple_data_export.ReportCursor', None),
+        ('simple_data_export.ReportJob', 'requested'),
+        ('simple_data_export.ReportJobBatchRequest', 'requested'),
+        ('simple_data_export.ReportTransmission', 'created'),
+        ('simple_data_export.ReportJobArchive', 'archived'),
     )
 
     prefix = 'simple_data_export_backup_' + settings.ALLOWED_HOSTS[0]
@@ -41,32 +71,44 @@ def incremental_backup(parameters):
     except AttributeError:
         pass
 
-    for app in dumpdata_apps:
+    chunk_size = BACKUP_CHUNK_SIZE
+
+    try:
+        chunk_size = settings.SIMPLE_DATA_EXPORT_BACKUP_CHUNK_SIZE
+    except AttributeError:
+        pass
+
+    for app, date_field in dumpdata_apps:
         logger.info('[simple_data_export] Backing up %s...', app)
         sys.stdout.flush()
 
-        buf = io.StringIO()
-        management.call_command('dumpdata', app, stdout=buf)
-        buf.seek(0)
+        queryset = apps.get_model(app)._default_manager.order_by('pk') # pylint: disable=protected-access
 
-        database_dump = buf.read()
+        if date_field is not None:
+            if 'start_date' in parameters:
+                queryset = queryset.filter(**{date_field + '__gte': parameters['start_date']})
 
-        buf = None
+            if 'end_date' in parameters:
+                queryset = queryset.filter(**{date_field + '__lt': parameters['end_date']})
 
-        gc.collect()
+        filename = prefix + '_' + slugify(app) + '.json-dumpdata.bz2'
 
-        compressed_str = bz2.compress(database_dump.encode('utf-8'))
+        path = os.path.join(backup_staging, filename)
 
-        database_dump = None
+        # Rows are fetched in chunks & serialized one at a time into the compressor,
+        # so memory use does not grow with the size of the table.
 
-        gc.collect()
+        with io.open(path, 'wb') as fixture_file:
+            stream = BZ2StreamWriter(fixture_file)
 
-        filename = prefix + '_' + slugify(app) + '.json-dumpdata.bz2'
+            if django.VERSION >= (2, 0):
+                rows = queryset.iterator(chunk_size=chunk_size)
+            else:
+                rows = queryset.iterator() # Django 1.11 uses a fixed chunk size.
 
-        path = os.path.join(backup_staging, filename)
+            serializers.serialize('json', rows, stream=stream)
 
-        with io.open(path, 'wb') as fixture_file:
-            fixture_file.write(compressed_str)
+            stream.close()
 
         to_transmit.append(path)
 
@@ -0,0 +1,248 @@
+# pylint: disable=line-too-long
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .utils import fetch_export_apis
+
+PINNED_RESULT_PREFIX = 'simple_data_export_pinned_'
+
+RESULT_CACHE_COUNTERS = (
+    'hits',
+    'misses',
+    'stores',
+    'evictions',
+    'bytes_saved',
+)
+
+def result_cache_directory():
+    # Caching is disabled unless a directory is configured.
+
+    try:
+        return settings.SIMPLE_DATA_EXPORT_RESULT_CACHE_DIR
+    except AttributeError:
+        pass
+
+    return None
+
+def result_cache_max_bytes():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_RESULT_CACHE_MAX_BYTES
+    except AttributeError:
+        pass
+
+    return 10 * 1024 * 1024 * 1024
+
+def result_cache_min_age():
+    # Entries used more recently than this may still be read by a report being assembled & are not evicted.
+
+    try:
+        return settings.SIMPLE_DATA_EXPORT_RESULT_CACHE_MIN_AGE
+    except AttributeError:
+        pass
+
+    return 15 * 60
+
+def fetch_export_cache_version(export_api, data_type):
+    # Exporters opt in per data type by returning a version from export_cache_version. Changing the
+    # version invalidates earlier results.
+
+    if (export_api in fetch_export_apis('export_cache_version')) is False:
+        return None
+
+    return export_api.export_cache_version(data_type)
+
+def result_cache_key(export_api, data_type, data_sources, start_time, end_time, custom_parameters, extra=None): # pylint: disable=too-many-arguments, too-many-positional-arguments
+    # Returns None for slices that may still change - caching requires a closed window in the past.
+
+    if result_cache_directory() is None or end_time is None or end_time > timezone.now():
+        return None
+
+    version = fetch_export_cache_version(export_api, data_type)
+
+    if version is None:
+        return None
+
+    inputs = {
+        'exporter': export_api.__name__,
+        'version': version,
+        'data_type': data_type,
+        'data_sources': data_sources,
+        'start_time': start_time,
+        'end_time': end_time,
+        'custom_parameters': custom_parameters,
+        'extra': extra,
+    }
+
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def result_cache_entry(key):
+    return os.path.join(result_cache_directory(), key[:2], key)
+
+def increment_counter(name, amount=1):
+    key = 'simple_data_export_result_cache_%s' % name
+
+    if cache.add(key, amount, timeout=None) is False:
+        try:
+            cache.incr(key, amount)
+        except ValueError: # Evicted between add & incr.
+            cache.add(key, amount, timeout=None)
+
+def result_cache_stats():
+    return dict((name, cache.get('simple_data_export_result_cache_%s' % name, 0)) for name in RESULT_CACHE_COUNTERS)
+
+def link_or_copy(source_path, destination_path):
+    try:
+        os.link(source_path, destination_path)
+    except (AttributeError, OSError): # Different file systems, or no hard links.
+        shutil.copy2(source_path, destination_path)
+
+def pin_cached_result(path):
+    # Jobs use a private link (or copy) of a cached result, so that other workers may evict the entry while
+    # the job is still running. Returns None if the entry has already been evicted.
+
+    directory = tempfile.mkdtemp(prefix=PINNED_RESULT_PREFIX)
+
+    pinned_path = os.path.join(directory, os.path.basename(path))
+
+    try:
+        link_or_copy(path, pinned_path)
+    except (IOError, OSError):
+        shutil.rmtree(directory, ignore_errors=True)
+
+        return None
+
+    return pinned_path
+
+def release_result(file_path):
+    # Removes the private directory of a pinned result once the job is done with it.
+
+    directory = os.path.dirname(file_path)
+
+    if os.path.basename(directory).startswith(PINNED_RESULT_PREFIX):
+        shutil.rmtree(directory, ignore_errors=True)
+
+def fetch_cached_result(key):
+    entry = result_cache_entry(key)
+
+    try:
+        names = os.listdir(entry)
+    except OSError:
+        names = []
+
+    pinned_path = None
+
+    if len(names) == 1:
+        try:
+            os.utime(entry, None) # Recently used entries are evicted last.
+        except OSError:
+            pass
+
+        pinned_path = pin_cached_result(os.path.join(entry, names[0]))
+
+    if pinned_path is None:
+        increment_counter('misses')
+
+        return None
+
+    increment_counter('hits')
+    increment_counter('bytes_saved', os.path.getsize(pinned_path))
+
+    return pinned_path
+
+def store_cached_result(key, file_path):
+    # Adds a link (or copy) of an exporter's output to the cache. The job keeps using file_path. Entries are
+    # staged in a temporary directory & renamed into place so that concurrent workers never see partial files.
+
+    entry = result_cache_entry(key)
+
+    staging = '%s.%s.tmp' % (entry, uuid.uuid4().hex)
+
+    os.makedirs(staging)
+
+    try:
+        link_or_copy(file_path, os.path.join(staging, os.path.basename(file_path)))
+
+        os.rename(staging, entry)
+    except (IOError, OSError): # Another worker stored the same result first, or the output could not be staged.
+        shutil.rmtree(staging, ignore_errors=True)
+
+        return False
+
+    increment_counter('stores')
+
+    return True
+
+def prune_result_cache():
+    # Evicts least recently used entries until the cache fits within its size limit. Called once reports are
+    # assembled, so the limit may be exceeded briefly by entries in use.
+
+    directory = result_cache_directory()
+
+    if directory is None or os.path.isdir(directory) is False:
+        return 0
+
+    entries = []
+    total_size = 0
+
+    min_mtime = time.time() - result_cache_min_age()
+
+    for prefix in os.listdir(directory):
+        prefix_path = os.path.join(directory, prefix)
+
+        if os.path.isdir(prefix_path) is False:
+            continue
+
+        for name in os.listdir(prefix_path):
+            path = os.path.join(prefix_path, name)
+
+            try:
+                if os.path.isdir(path) is False:
+                    continue
+
+                mtime = os.stat(path).st_mtime
+
+                if name.endswith('.tmp'):
+                    if mtime < min_mtime: # Abandoned by a worker that stopped mid-store.
+                        shutil.rmtree(path, ignore_errors=True)
+
+                    continue
+
+                size = 0
+
+                for item in os.listdir(path):
+                    size += os.stat(os.path.join(path, item)).st_size
+
+                entries.append((mtime, size, path))
+
+                total_size += size
+            except OSError: # Evicted by another worker.
+                pass
+
+    entries.sort()
+
+    evicted = 0
+
+    max_bytes = result_cache_max_bytes()
+
+    while entries and total_size > max_bytes and entries[0][0] < min_mtime:
+        _, size, path = entries.pop(0)
+
+        shutil.rmtree(path, ignore_errors=True)
+
+        total_size -= size
+        evicted += 1
+
+    if evicted > 0:
+        increment_counter('evictions', evicted)
+
+    return evicted
@@ -1,226 +1,463 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=no-member,line-too-long
 
-import importlib
+import concurrent.futures
 import io
 import json
 import logging
+import multiprocessing
 import os
 import tempfile
+import threading
 import traceback
 import zipfile
 
 import arrow
 import pytz
-import zipstream
+
+import django
 
 from django.conf import settings
 from django.core.files import File
 from django.core.mail import send_mail
 from django.core.management.base import BaseCommand
+from django.db import connection, connections
 from django.template.loader import render_to_string
 from django.utils import timezone
 
 from quicksilver.decorators import handle_lock, handle_schedule, handle_logging, add_qs_arguments
 
-from ...models import ReportJob, ReportJobBatchRequest, ReportDestination
+from ...archive_utils import ReportZipFile, fetch_compression
+from ...export_cache import fetch_cached_result, prune_result_cache, release_result, result_cache_directory, result_cache_key, result_cache_stats, store_cached_result
+from ...models import ReportCursor, ReportJob, ReportJobBatchRequest, ReportTransmission, report_job_lease_duration
+from ...utils import export_api_accepts, fetch_data_type_export_apis, fetch_export_writer
 
 REMOVE_SLEEP_MAX = 60 # Added to avoid "WindowsError: [Error 32] The process cannot access the file because it is being used by another process"
 
-class Command(BaseCommand):
-    help = 'Compiles request data export reports.'
+class ReportJobHeartbeat(threading.Thread):
+    def __init__(self, report, logger):
+        super(ReportJobHeartbeat, self).__init__() # pylint: disable=super-with-arguments
 
-    @add_qs_arguments
-    def add_arguments(self, parser):
+        self.daemon = True
+
+        self.report = report
+        self.logger = logger
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = max(report_job_lease_duration() / 3.0, 1.0)
+
+        try:
+            while self.stopped.wait(interval) is False and self.report.completed is None:
+                if self.report.renew_lease() is False:
+                    self.logger.warning('%s: Lost lease on report job %s. Another worker may reclaim it.', __name__, self.report.pk)
+
+                    break
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def remove_file(path):
+    remove_sleep = 1.0
+
+    while remove_sleep < REMOVE_SLEEP_MAX:
+        try:
+            os.remove(path)
+
+            remove_sleep = REMOVE_SLEEP_MAX
+        except OSError:
+            remove_sleep = remove_sleep * 2
+
+            if remove_sleep >= REMOVE_SLEEP_MAX:
+                traceback.print_exc()
+
+def fetch_data_type_compression(data_type, custom_parameters):
+    compression = custom_parameters.get('compression', None)
+    level = custom_parameters.get('compression_level', None)
+
+    if compression is None:
+        try:
+            compression = settings.SIMPLE_DATA_EXPORT_COMPRESSION
+        except AttributeError:
+            pass
+
+    if level is None:
+        try:
+            level = settings.SIMPLE_DATA_EXPORT_COMPRESSION_LEVEL
+        except AttributeError:
+            pass
+
+    data_type_compression = {}
+
+    try:
+        data_type_compression.update(settings.SIMPLE_DATA_EXPORT_DATA_TYPE_COMPRESSION)
+    except AttributeError:
         pass
 
-    @handle_logging
-    @handle_schedule
-    @handle_lock
-    def handle(self, *args, **options): # pylint: disable=too-many-locals,too-many-branches,too-many-statements
-        os.umask(000)
+    data_type_compression.update(custom_parameters.get('data_type_compression', {}))
 
-        here_tz = pytz.timezone(settings.TIME_ZONE)
+    compression = data_type_compression.get(data_type, compression)
 
-        pending = ReportJob.objects.filter(started=None, completed=None)
+    return fetch_compression(compression, level)
 
-        logger = options.get('_logger', None)
+def compile_data_type(data_type, data_sources, start_time, end_time, custom_parameters, logger=None, since=None): # pylint: disable=too-many-arguments, too-many-positional-arguments, too-many-locals, too-many-branches
+    if logger is None:
+        logger = logging.getLogger(__name__)
 
-        if logger is None:
-            logger = logging.getLogger(__name__)
+    writer = fetch_export_writer(custom_parameters)
+
+    for export_api in fetch_data_type_export_apis(data_type):
+        try:
+            options = {}
+
+            if export_api_accepts(export_api, 'compile_data_export', 'writer'):
+                options['writer'] = writer
+            elif writer.export_format != 'csv':
+                logger.warning('%s: %s "%s" exporter does not accept a writer argument. Ignoring "%s" export format.', __name__, export_api.__name__, data_type, writer.export_format)
+
+            export_start_time = start_time
+
+            if since is not None:
+                if export_api_accepts(export_api, 'compile_data_export', 'since'):
+                    options['since'] = since
+                elif since and None not in since.values():
+                    # Exporters without per-source cursors export from the oldest high-water mark instead.
+
+                    cursor_time = min(since.values())
+
+                    if export_start_time is None or cursor_time > export_start_time:
+                        export_start_time = cursor_time
+
+            cache_key = result_cache_key(export_api, data_type, data_sources, export_start_time, end_time, custom_parameters, extra={'export_format': writer.export_format, 'since': options.get('since', None)})
+
+            if cache_key is not None:
+                file_path = fetch_cached_result(cache_key)
+
+                if file_path is not None:
+                    logger.debug('%s: Reusing cached "%s" export: %s', __name__, data_type, file_path)
+
+                    return file_path
+
+            file_path = export_api.compile_data_export(data_type, data_sources, start_time=export_start_time, end_time=end_time, custom_parameters=custom_parameters, **options)
+
+            if file_path is not None:
+                file_path = os.path.normpath(file_path)
+
+                if cache_key is not None:
+                    store_cached_result(cache_key, file_path)
+
+                return file_path
+        except TypeError as exception:
+            traceback.print_exc()
+            logger.error('Verify that %s "%s" exporter implements all compile_data_export arguments!', export_api.__name__, data_type)
+            raise exception
+
+    return None
+
+def compile_data_type_thread(data_type, data_sources, start_time, end_time, custom_parameters, logger, since=None): # pylint: disable=too-many-arguments, too-many-positional-arguments
+    try:
+        return compile_data_type(data_type, data_sources, start_time, end_time, custom_parameters, logger, since)
+    finally:
+        connection.close()
+
+def compile_data_type_process(data_type, data_sources, start_time, end_time, custom_parameters, since=None): # pylint: disable=too-many-arguments, too-many-positional-arguments
+    # ProcessPoolExecutor only accepts an initializer on Python 3.7+, so each task prepares its own process.
+
+    initialize_worker()
+
+    try:
+        return compile_data_type(data_type, data_sources, start_time, end_time, custom_parameters, None, since)
+    finally:
+        connections.close_all()
+
+def compile_data_types(data_types, data_sources, start_time, end_time, custom_parameters, logger, data_type_workers=1, since=None): # pylint: disable=too-many-arguments, too-many-positional-arguments
+    if since is None:
+        since = {}
+
+    if data_type_workers is None or data_type_workers < 2 or len(data_types) < 2:
+        return [compile_data_type(data_type, data_sources, start_time, end_time, custom_parameters, logger, since.get(data_type, None)) for data_type in data_types]
+
+    pool_type = 'thread'
+
+    try:
+        pool_type = settings.SIMPLE_DATA_EXPORT_DATA_TYPE_POOL
+    except AttributeError:
+        pass
+
+    if pool_type == 'process' and multiprocessing.current_process().daemon:
+        logger.warning('%s: Report workers may not start child processes. Compiling data types in threads instead.', __name__)
+
+        pool_type = 'thread'
+
+    workers = min(data_type_workers, len(data_types))
+
+    if pool_type == 'process':
+        connections.close_all()
+
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        futures = [executor.submit(compile_data_type_process, data_type, data_sources, start_time, end_time, custom_parameters, since.get(data_type, None)) for data_type in data_types]
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(compile_data_type_thread, data_type, data_sources, start_time, end_time, custom_parameters, logger, since.get(data_type, None)) for data_type in data_types]
+
+    with executor:
+        # Results are collected in request order so that archive layout does not depend on completion order.
+
+        return [future.result() for future in futures]
+
+def compile_report(report, logger, data_type_workers=1): # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    here_tz = pytz.timezone(settings.TIME_ZONE)
+
+    parameters = json.loads(report.parameters)
+
+    data_sources = parameters['data_sources']
+    data_types = parameters['data_types']
+
+    custom_parameters = parameters['custom_parameters']
+
+    start_time = None
+    end_time = None
+
+    if 'start_time' in parameters and parameters['start_time']:
+        start_time = arrow.get(parameters['start_time']).datetime
+
+    if 'end_time' in parameters and parameters['end_time']:
+        end_time = arrow.get(parameters['end_time']).datetime
+
+    # Incremental jobs export each data source from its last high-water mark & advance the marks once the report is complete.
+    # Open-ended jobs are bounded at the high-water mark, so rows written while exporting are left for the next report.
+
+    incremental = parameters.get('incremental', False)
+
+    since = {}
+    high_water = None
+
+    if incremental:
+        if end_time is None:
+            end_time = timezone.now()
+
+        high_water = end_time
+
+        for data_type in data_types:
+            since[data_type] = ReportCursor.objects.fetch_since(report.requester, data_sources, data_type)
+
+    prefix = 'simple_data_export_final'
+
+    if 'prefix' in parameters:
+        prefix = parameters['prefix']
+
+    suffix = report.started.astimezone(here_tz).date().isoformat()
+
+    if 'suffix' in parameters:
+        suffix = parameters['suffix']
 
-        logger.debug('%s: Pending report jobs: %s', __name__, pending.count())
+    filename = '%s%s%s_%s_%s.zip' % (tempfile.gettempdir(), os.path.sep, prefix, report.pk, suffix)
 
-        while pending.count() > 0:
-            report = ReportJob.objects.filter(started=None, completed=None)\
-                                      .order_by('requested', 'pk')\
-                                      .first()
+    # Resolve compression & export format up front so that invalid settings fail before exporters run.
 
-            if report is not None:
-                report.started = timezone.now()
-                report.save()
+    compressions = dict((data_type, fetch_data_type_compression(data_type, custom_parameters)) for data_type in data_types)
 
-                parameters = json.loads(report.parameters)
+    fetch_export_writer(custom_parameters)
 
-                data_sources = parameters['data_sources']
-                data_types = parameters['data_types']
+    to_delete = []
 
-                custom_parameters = parameters['custom_parameters']
+    # Loose files & nested exporter archives are written to the final archive in a single pass.
 
-                start_time = None
-                end_time = None
+    with io.open(filename, 'wb') as final_output_file:
+        with ReportZipFile(final_output_file, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zip_output:
+            output_files = compile_data_types(data_types, data_sources, start_time, end_time, custom_parameters, logger, data_type_workers=data_type_workers, since=since)
 
-                if 'start_time' in parameters and parameters['start_time']:
-                    start_time = arrow.get(parameters['start_time']).datetime
+            for data_type, output_file in zip(data_types, output_files):
+                if output_file is not None:
+                    if output_file.lower().endswith('.zip'):
+                        zip_output.copy_members(output_file)
+                    else:
+                        name = os.path.basename(os.path.normpath(output_file))
 
-                if 'end_time' in parameters and parameters['end_time']:
-                    end_time = arrow.get(parameters['end_time']).datetime
+                        compress_type, compress_level = compressions[data_type]
 
-                prefix = 'simple_data_export_final'
+                        if compress_level is None:
+                            zip_output.write(output_file, name, compress_type=compress_type)
+                        else:
+                            zip_output.write(output_file, name, compress_type=compress_type, compresslevel=compress_level)
 
-                if 'prefix' in parameters:
-                    prefix = parameters['prefix']
+                    to_delete.append(output_file)
 
-                suffix = report.started.astimezone(here_tz).date().isoformat()
+    for output_file in to_delete:
+        remove_file(output_file)
+        release_result(output_file)
 
-                if 'suffix' in parameters:
-                    suffix = parameters['suffix']
+    prune_result_cache()
 
-                filename = '%s%s%s_%s_%s.zip' % (tempfile.gettempdir(), os.path.sep, prefix, report.pk, suffix)
+    with io.open(filename, 'rb') as report_file:
+        report.report.save(filename.split(os.path.sep)[-1], File(report_file), save=False)
 
-                zips_to_merge = []
+    report.report_size = report.report.size
 
-                with io.open(filename, 'wb') as final_output_file:
-                    with zipstream.ZipFile(mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as export_stream: # pylint: disable=line-too-long
-                        to_delete = []
+    if report.complete() is False:
+        # Another worker reclaimed the job after this lease lapsed - it sends the report, so discard this copy.
 
-                        for data_type in data_types: # pylint: disable=too-many-nested-blocks
-                            output_file = None
+        logger.warning('%s: Lost claim on report job %s before completing it. Discarding compiled report.', __name__, report.pk)
 
-                            for app in settings.INSTALLED_APPS:
-                                if output_file is None:
-                                    try:
-                                        export_api = importlib.import_module(app + '.simple_data_export_api')
+        report.report.delete(save=False)
 
-                                        try:
-                                            file_path = export_api.compile_data_export(data_type, data_sources, start_time=start_time, end_time=end_time, custom_parameters=custom_parameters)
+        remove_file(filename)
 
-                                            if file_path is not None:
-                                                output_file = os.path.normpath(file_path)
+        return False
 
-                                                if output_file is not None:
-                                                    output_file = os.path.normpath(output_file)
+    if incremental:
+        ReportCursor.objects.advance(report.requester, data_sources, data_types, high_water)
 
-                                                    if output_file.lower().endswith('.zip'):
-                                                        zips_to_merge.append(output_file)
-                                                    else:
-                                                        name = os.path.basename(os.path.normpath(output_file))
+    if report.requester.email is not None:
+        site_human_name = 'Simple Data Exporter'
 
-                                                        export_stream.write(output_file, name, compress_type=zipfile.ZIP_DEFLATED)
+        try:
+            site_human_name = settings.SIMPLE_DATA_EXPORTER_SITE_NAME
+        except AttributeError:
+            pass
 
-                                                        to_delete.append(output_file)
-                                        except TypeError as exception:
-                                            traceback.print_exc()
-                                            logger.error('Verify that %s "%s" exporter implements all compile_data_export arguments!', app, data_type)
-                                            raise exception
+        subject = render_to_string('simple_data_export_report_subject.txt', {
+            'report': report,
+            'url': settings.SITE_URL,
+            'name': site_human_name
+        })
 
-                                    except ImportError:
-                                        output_file = None
-                                    except AttributeError:
-                                        output_file = None
+        if 'email_subject' in parameters:
+            subject = parameters['email_subject']
 
-                        for data in export_stream:
-                            final_output_file.write(data)
+        message = render_to_string('simple_data_export_report_message.txt', {
+            'report': report,
+            'url': settings.SITE_URL,
+            'name': site_human_name
+        })
 
-                        for output_file in to_delete:
-                            remove_sleep = 1.0
+        tokens = settings.SITE_URL.split('/')
+        host = ''
 
-                            while remove_sleep < REMOVE_SLEEP_MAX:
-                                try:
-                                    os.remove(output_file)
+        while tokens and tokens[-1] == '':
+            tokens.pop()
 
-                                    remove_sleep = REMOVE_SLEEP_MAX
-                                except OSError:
-                                    remove_sleep = remove_sleep * 2
+        if tokens:
+            host = tokens[-1]
 
-                                    if remove_sleep >= REMOVE_SLEEP_MAX:
-                                        traceback.print_exc()
+        from_addr = site_human_name + ' <noreply@' + host + '>'
 
-                if zips_to_merge:
-                    with zipfile.ZipFile(filename, 'a', compression=zipfile.ZIP_DEFLATED) as zip_output:
-                        for zip_filename in zips_to_merge:
-                            with zipfile.ZipFile(zip_filename, 'r') as zip_file:
-                                for child_file in zip_file.namelist():
-                                    with zip_file.open(child_file) as child_stream:
-                                        zip_output.writestr(child_file, child_stream.read())
+        try:
+            from_addr = settings.SIMPLE_DATA_EXPORT_FROM_ADDRESS
 
-                report.completed = timezone.now()
+        except AttributeError:
+            pass
 
-                with io.open(filename, 'rb') as report_file:
-                    report.report.save(filename.split(os.path.sep)[-1], File(report_file))
+        send_mail(subject, message, from_addr, [report.requester.email], fail_silently=False)
 
-                report.save()
+    ReportTransmission.objects.enqueue(report, destinations=parameters.get('destinations', None))
 
-                if report.requester.email is not None:
-                    site_human_name = 'Simple Data Exporter'
+    remove_file(filename)
 
-                    try:
-                        site_human_name = settings.SIMPLE_DATA_EXPORTER_SITE_NAME
-                    except AttributeError:
-                        pass
+    return True
 
-                    subject = render_to_string('simple_data_export_report_subject.txt', {
-                        'report': report,
-                        'url': settings.SITE_URL,
-                        'name': site_human_name
-                    })
+def compile_pending_reports(logger, data_type_workers=1):
+    compiled = 0
 
-                    if 'email_subject' in parameters:
-                        subject = parameters['email_subject']
+    for failed in ReportJob.objects.fail_exhausted_jobs():
+        logger.error('%s: Report job %s did not complete after %s claims. Marked failed & skipped.', __name__, failed.pk, failed.claim_count)
 
-                    message = render_to_string('simple_data_export_report_message.txt', {
-                        'report': report,
-                        'url': settings.SITE_URL,
-                        'name': site_human_name
-                    })
+    report = ReportJob.objects.claim_job()
 
-                    tokens = settings.SITE_URL.split('/')
-                    host = ''
+    while report is not None:
+        logger.debug('%s: Compiling report job %s (%s of %s, claim %s)...', __name__, report.pk, report.job_index, report.job_count, report.claim_count)
 
-                    while tokens and tokens[-1] == '':
-                        tokens.pop()
+        heartbeat = ReportJobHeartbeat(report, logger)
+        heartbeat.start()
 
-                    if tokens:
-                        host = tokens[-1]
+        try:
+            if compile_report(report, logger, data_type_workers=data_type_workers):
+                compiled += 1
+        finally:
+            heartbeat.stop()
 
-                    from_addr = site_human_name + ' <noreply@' + host + '>'
+        report = ReportJob.objects.claim_job()
 
-                    try:
-                        from_addr = settings.SIMPLE_DATA_EXPORT_FROM_ADDRESS
+    return compiled
 
-                    except AttributeError:
-                        pass
+def initialize_worker():
+    django.setup()
+
+    # Connections inherited from the parent process must not be shared across workers.
+
+    connections.close_all()
+
+def compile_pending_reports_worker(data_type_workers):
+    try:
+        return compile_pending_reports(logging.getLogger(__name__), data_type_workers=data_type_workers)
+    finally:
+        connections.close_all()
+
+class Command(BaseCommand):
+    help = 'Compiles request data export reports.'
+
+    @add_qs_arguments
+    def add_arguments(self, parser):
+        workers = 1
+
+        try:
+            workers = settings.SIMPLE_DATA_EXPORT_REPORT_WORKERS
+        except AttributeError:
+            pass
+
+        data_type_workers = 1
+
+        try:
+            data_type_workers = settings.SIMPLE_DATA_EXPORT_DATA_TYPE_WORKERS
+        except AttributeError:
+            pass
+
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=workers,
+                            help='Number of worker processes compiling report jobs concurrently')
+
+        parser.add_argument('--data-type-workers',
+                            type=int,
+                            dest='data_type_workers',
+                            default=data_type_workers,
+                            help='Number of data types compiled concurrently within each report job')
+
+    @handle_logging
+    @handle_schedule
+    @handle_lock
+    def handle(self, *args, **options):
+        os.umask(000)
+
+        logger = options.get('_logger', None)
+
+        if logger is None:
+            logger = logging.getLogger(__name__)
 
-                    send_mail(subject, message, from_addr, [report.requester.email], fail_silently=False)
+        workers = options.get('workers', 1)
+        data_type_workers = options.get('data_type_workers', 1)
 
-                try:
-                    for extra_destination in ReportDestination.objects.filter(user=report.requester):
-                        extra_destination.transmit(filename, report)
-                except AttributeError:
-                    traceback.print_exc()
+        if workers is not None and workers > 1:
+            connections.close_all()
 
-                remove_sleep = 1.0
+            pool = multiprocessing.Pool(processes=workers, initializer=initialize_worker) # pylint: disable=consider-using-with
 
-                while remove_sleep < REMOVE_SLEEP_MAX:
-                    try:
-                        os.remove(filename)
+            try:
+                compiled = sum(pool.map(compile_pending_reports_worker, [data_type_workers] * workers))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            compiled = compile_pending_reports(logger, data_type_workers=data_type_workers)
 
-                        remove_sleep = REMOVE_SLEEP_MAX
-                    except OSError:
-                        remove_sleep = remove_sleep * 2
+        logger.debug('%s: Compiled report jobs: %s', __name__, compiled)
 
-                        if remove_sleep >= REMOVE_SLEEP_MAX:
-                            traceback.print_exc()
+        if result_cache_directory() is not None:
+            logger.debug('%s: Result cache: %s', __name__, result_cache_stats())
 
         request = ReportJobBatchRequest.objects.filter(started=None, completed=None)\
                       .order_by('requested', 'pk')\
@@ -228,7 +465,7 @@ class Command(BaseCommand):
 
         logger.debug('%s: Pending report job batch request: %s', __name__, request)
 
-        if request is not None:
-            request.process()
+        if request is not None and request.process() is False:
+            logger.debug('%s: Batch request %s claimed by another worker.', __name__, request.pk)
 
         logger.debug('%s: Going to sleep...', __name__)
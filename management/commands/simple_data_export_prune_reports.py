@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=no-member,line-too-long
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from quicksilver.decorators import handle_lock, handle_schedule, handle_logging, add_qs_arguments
+
+from ...models import prune_report_jobs, retention_setting
+
+class Command(BaseCommand):
+    help = 'Deletes completed & failed report jobs & their files outside the configured retention policy.'
+
+    @add_qs_arguments
+    def add_arguments(self, parser):
+        parser.add_argument('--archive',
+                            action='store_true',
+                            dest='archive',
+                            default=retention_setting('ARCHIVE', False),
+                            help='Keep a compact record of each pruned report job')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=retention_setting('BATCH_SIZE', 500),
+                            help='Number of report jobs deleted per transaction')
+
+    @handle_logging
+    @handle_schedule
+    @handle_lock
+    def handle(self, *args, **options):
+        logger = options.get('_logger', None)
+
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        pruned = prune_report_jobs(archive=options.get('archive', False), batch_size=max(options.get('batch_size', 500), 1))
+
+        logger.debug('%s: Pruned report jobs: %s', __name__, pruned)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=no-member,line-too-long
+
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from quicksilver.decorators import handle_lock, handle_schedule, handle_logging, add_qs_arguments
+
+from ...models import ReportSchedule
+
+class Command(BaseCommand):
+    help = 'Creates report job batch requests for scheduled data exports that are due.'
+
+    @add_qs_arguments
+    def add_arguments(self, parser):
+        pass
+
+    @handle_logging
+    @handle_schedule
+    @handle_lock
+    def handle(self, *args, **options):
+        logger = options.get('_logger', None)
+
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        now = timezone.now()
+
+        # New schedules start at their next cron time rather than immediately.
+
+        for schedule in ReportSchedule.objects.filter(active=True, next_run=None):
+            try:
+                schedule.next_run = schedule.fetch_next_run(now)
+                schedule.save()
+
+                logger.debug('%s: Scheduled "%s" for %s.', __name__, schedule.name, schedule.next_run)
+            except ValueError:
+                logger.error('%s: Unable to schedule "%s": invalid cron expression "%s".', __name__, schedule.name, schedule.schedule)
+
+        claimed = ReportSchedule.objects.claim_schedule()
+
+        while claimed is not None:
+            schedule, scheduled = claimed
+
+            if schedule.is_running():
+                logger.warning('%s: Skipping run of "%s" scheduled for %s. Previous run is still in progress.', __name__, schedule.name, scheduled)
+            else:
+                if schedule.is_unfinished():
+                    logger.warning('%s: Previous run of "%s" (batch request %s) is stale. Starting a new run.', __name__, schedule.name, schedule.last_batch.pk)
+
+                batch_request = schedule.run(scheduled)
+
+                logger.debug('%s: Created batch request %s for "%s" (scheduled for %s).', __name__, batch_request.pk, schedule.name, scheduled)
+
+            claimed = ReportSchedule.objects.claim_schedule()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=no-member,line-too-long
+
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from quicksilver.decorators import handle_lock, handle_schedule, handle_logging, add_qs_arguments
+
+from ...models import ReportTransmission
+from ...simple_data_export_api import close_sftp_sessions
+
+def transmission_timeout():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_TRANSMISSION_TIMEOUT
+    except AttributeError:
+        pass
+
+    return 60 * 60
+
+class DestinationTransmission(threading.Thread):
+    def __init__(self, transmission, slots, logger):
+        super(DestinationTransmission, self).__init__() # pylint: disable=super-with-arguments
+
+        self.daemon = True
+
+        self.transmission = transmission
+        self.slots = slots
+        self.logger = logger
+
+        self.transmitted = None
+        self.error = None
+
+    def transmit(self):
+        try:
+            self.transmitted = self.transmission.send()
+        except: # pylint: disable=bare-except
+            self.error = traceback.format_exc()
+
+            self.logger.error('%s: Error transmitting report job %s: %s', __name__, self.transmission.job_id, self.error)
+        finally:
+            connection.close()
+
+    def run(self):
+        try:
+            # Uploads cannot be interrupted, so a stalled upload is abandoned in its own
+            # daemon thread to free its slot for the remaining destinations. Outcomes are
+            # only recorded here, so an abandoned upload finishing late changes nothing.
+
+            upload = threading.Thread(target=self.transmit)
+            upload.daemon = True
+            upload.start()
+            upload.join(transmission_timeout())
+
+            if upload.is_alive():
+                self.logger.error('%s: Transmission of report job %s to destination %s (%s) timed out.', __name__, self.transmission.job_id, self.transmission.destination_id, self.transmission.destination.destination)
+
+                recorded = self.transmission.record_failure('Transmission timed out after %s seconds.' % transmission_timeout())
+            elif self.error is not None:
+                recorded = self.transmission.record_failure(self.error)
+            else:
+                recorded = self.transmission.record_outcome(self.transmitted)
+
+            if recorded is False:
+                self.logger.warning('%s: Transmission of report job %s to destination %s was reclaimed by another worker. Outcome discarded.', __name__, self.transmission.job_id, self.transmission.destination_id)
+        finally:
+            connection.close()
+
+            self.slots.release()
+
+class Command(BaseCommand):
+    help = 'Transmits compiled data export reports to their destinations, retrying failures with exponential backoff.'
+
+    @add_qs_arguments
+    def add_arguments(self, parser):
+        workers = 4
+
+        try:
+            workers = settings.SIMPLE_DATA_EXPORT_TRANSMISSION_WORKERS
+        except AttributeError:
+            pass
+
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=workers,
+                            help='Number of report transmissions running concurrently')
+
+    @handle_logging
+    @handle_schedule
+    @handle_lock
+    def handle(self, *args, **options):
+        logger = options.get('_logger', None)
+
+        if logger is None:
+            logger = logging.getLogger(__name__)
+
+        slots = threading.BoundedSemaphore(max(options.get('workers', 4), 1))
+
+        # Leave the lease some headroom past the upload timeout before another worker may retry.
+
+        lease_seconds = transmission_timeout() + 60
+
+        transmissions = []
+
+        while True:
+            # Only claim a transmission once a slot is free, so queued work stays available to other hosts.
+
+            slots.acquire() # pylint: disable=consider-using-with
+
+            transmission = ReportTransmission.objects.claim_transmission(lease_seconds)
+
+            if transmission is None:
+                slots.release()
+
+                break
+
+            logger.debug('%s: Transmitting report job %s to destination %s (attempt %s)...', __name__, transmission.job_id, transmission.destination_id, transmission.attempts)
+
+            worker = DestinationTransmission(transmission, slots, logger)
+            worker.start()
+
+            transmissions.append(worker)
+
+        for worker in transmissions:
+            worker.join()
+
+        close_sftp_sessions()
+
+        logger.debug('%s: Transmitted %s report(s).', __name__, len(transmissions))
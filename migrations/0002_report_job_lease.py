@@ -0,0 +1,34 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='claim_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
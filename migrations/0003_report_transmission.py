@@ -0,0 +1,30 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0002_report_job_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportTransmission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True)),
+                ('next_attempt', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_attempt', models.DateTimeField(blank=True, null=True)),
+                ('transmitted', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('failed', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, max_length=1048576, null=True)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transmissions', to='simple_data_export.reportdestination')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transmissions', to='simple_data_export.reportjob')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0003_report_transmission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_source', models.CharField(db_index=True, max_length=1024)),
+                ('data_type', models.CharField(db_index=True, max_length=1024)),
+                ('high_water', models.DateTimeField(db_index=True)),
+                ('updated', models.DateTimeField()),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simple_data_export_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('requester', 'data_source', 'data_type')},
+            },
+        ),
+    ]
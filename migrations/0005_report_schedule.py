@@ -0,0 +1,37 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0004_report_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=1024)),
+                ('active', models.BooleanField(default=True)),
+                ('schedule', models.CharField(help_text='Cron expression (minute, hour, day of month, month, day of week) in the site time zone.', max_length=1024)),
+                ('jitter', models.IntegerField(default=300, help_text='Maximum seconds added to each run to spread out schedules sharing a cron expression.')),
+                ('lookback', models.IntegerField(blank=True, help_text='Seconds of data exported before each run. Leave blank for all history.', null=True)),
+                ('data_sources', models.TextField(blank=True, help_text='JSON list of data sources. Leave blank for all data sources.', max_length=34359738368, null=True)),
+                ('data_types', models.TextField(default='[]', help_text='JSON list of data types.', max_length=34359738368)),
+                ('custom_parameters', models.TextField(default='{}', max_length=34359738368)),
+                ('incremental', models.BooleanField(default=False)),
+                ('next_run', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_run', models.DateTimeField(blank=True, null=True)),
+                ('destinations', models.ManyToManyField(blank=True, help_text="Leave blank for all of the requester's destinations.", related_name='schedules', to='simple_data_export.reportdestination')),
+                ('last_batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='schedules', to='simple_data_export.reportjobbatchrequest')),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simple_data_export_schedules', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0005_report_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='batch_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='simple_data_export.reportjobbatchrequest'),
+        ),
+    ]
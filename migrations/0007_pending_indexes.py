@@ -0,0 +1,38 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:38
+
+import django
+
+from django.conf import settings
+from django.db import migrations, models
+
+def pending_index(fields, condition, name):
+    # Partial indexes require Django 2.2+. Earlier versions index every row.
+
+    if django.VERSION >= (2, 2):
+        return models.Index(fields=fields, condition=condition, name=name)
+
+    return models.Index(fields=fields, name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0006_report_job_batch_request'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reportjob',
+            index=pending_index(['requested', 'id'], models.Q(('completed', None)), 'sde_report_job_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='reportjobbatchrequest',
+            index=pending_index(['requested', 'id'], models.Q(('completed', None), ('started', None)), 'sde_batch_request_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='reporttransmission',
+            index=pending_index(['next_attempt', 'id'], models.Q(('failed', None), ('transmitted', None)), 'sde_transmission_pending'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 11:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0007_pending_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='report_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReportJobArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.IntegerField(db_index=True)),
+                ('requested', models.DateTimeField(db_index=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('completed', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('job_index', models.IntegerField(default=1)),
+                ('job_count', models.IntegerField(default=1)),
+                ('data_types', models.TextField(default='[]', max_length=1048576)),
+                ('data_source_count', models.IntegerField(default=0)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('report_name', models.CharField(blank=True, max_length=1024, null=True)),
+                ('report_size', models.BigIntegerField(blank=True, null=True)),
+                ('archived', models.DateTimeField(db_index=True)),
+                ('requester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simple_data_export_archived_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 12:05
+
+import django
+
+from django.conf import settings
+from django.db import migrations, models
+
+def pending_index(fields, condition, name):
+    # Partial indexes require Django 2.2+. Earlier versions index every row.
+
+    if django.VERSION >= (2, 2):
+        return models.Index(fields=fields, condition=condition, name=name)
+
+    return models.Index(fields=fields, name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0008_report_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reportjob',
+            name='sde_report_job_pending',
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='failed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reportjob',
+            index=pending_index(['requested', 'id'], models.Q(('completed', None), ('failed', None)), 'sde_report_job_pending'),
+        ),
+    ]
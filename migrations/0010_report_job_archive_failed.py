@@ -0,0 +1,19 @@
+# pylint: skip-file
+# Generated by Django 5.2.17 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_data_export', '0009_report_job_failed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjobarchive',
+            name='failed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,31 +1,60 @@
-# pylint: disable=line-too-long
+# pylint: disable=line-too-long, no-member
 
-import importlib
+import datetime
+import hashlib
+import heapq
 import json
+import math
 import os
+import shutil
+import tempfile
+import uuid
 
+import arrow
+import pytz
 import requests
 
+import django
+
 from django.conf import settings
 from django.core.checks import Error, Warning, register # pylint: disable=redefined-builtin
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.db.models import F, Q
 from django.db.models.signals import post_delete
 from django.dispatch.dispatcher import receiver
 from django.urls import reverse
 from django.utils import timezone
 
+from .schedule_utils import next_cron_time
+from .utils import fetch_export_apis
+
 SIMPLE_DATA_EXPORT_FILE_FOLDER = 'simple_data_export_uploads'
 
+def pending_index(fields, condition, name):
+    # Partial indexes require Django 2.2+. Earlier versions index every row.
+
+    if django.VERSION >= (2, 2):
+        return models.Index(fields=fields, condition=condition, name=name)
+
+    return models.Index(fields=fields, name=name)
+
 class ReportJobManager(models.Manager): # pylint: disable=too-few-public-methods
-    def create_jobs(self, requester, data_sources, data_types, start_time=None, end_time=None, custom_parameters=None): # pylint: disable=too-many-arguments, no-self-use, too-many-positional-arguments
+    def create_jobs(self, requester, data_sources, data_types, start_time=None, end_time=None, custom_parameters=None, incremental=False, destinations=None): # pylint: disable=too-many-arguments, no-self-use, too-many-positional-arguments
         batch_request = ReportJobBatchRequest(requester=requester, requested=timezone.now())
 
         job_parameters = {}
 
-        job_parameters['data_sources'] = data_sources
+        if data_sources is not None: # None exports all available data sources.
+            job_parameters['data_sources'] = data_sources
+
         job_parameters['data_types'] = list(set(data_types))
         job_parameters['start_time'] = start_time
         job_parameters['end_time'] = end_time
+        job_parameters['incremental'] = incremental
+
+        if destinations is not None:
+            job_parameters['destinations'] = destinations
 
         if custom_parameters is not None:
             job_parameters['custom_parameters'] = custom_parameters
@@ -36,7 +65,85 @@ class ReportJobManager(models.Manager): # pylint: disable=too-few-public-methods
 
         batch_request.save()
 
+        return batch_request
+
+    def fail_exhausted_jobs(self):
+        # Marks jobs failed once their last permitted claim expires without completing, & returns them.
+
+        now = timezone.now()
+
+        failed = []
+
+        for job in self.filter(completed=None, failed=None, claim_count__gte=report_job_max_claims(), lease_expires__lt=now):
+            marked = self.filter(pk=job.pk, completed=None, failed=None, claim_token=job.claim_token).update(failed=now)
+
+            if marked == 1:
+                job.failed = now
+
+                failed.append(job)
+
+        return failed
+
+    def claim_job(self):
+        max_claims = report_job_max_claims()
+
+        while True:
+            with transaction.atomic(using=self.db):
+                now = timezone.now()
+
+                # Pending jobs, plus jobs whose worker stopped renewing its lease.
+
+                pending = self.filter(completed=None, failed=None, claim_count__lt=max_claims)\
+                              .filter(Q(started=None) | Q(lease_expires__lt=now))
+
+                if connections[self.db].features.has_select_for_update_skip_locked:
+                    pending = pending.select_for_update(skip_locked=True)
+
+                job = pending.order_by('requested', 'pk').first()
+
+                if job is None:
+                    return None
+
+                claim_token = uuid.uuid4().hex
+                lease_expires = now + datetime.timedelta(seconds=report_job_lease_duration())
+
+                # Conditional update guards backends without row-level locks against concurrent claims.
+
+                claimed = self.filter(pk=job.pk, completed=None, claim_token=job.claim_token)\
+                              .update(started=now, claim_token=claim_token, claim_count=(F('claim_count') + 1), lease_expires=lease_expires, heartbeat=now)
+
+                if claimed == 1:
+                    job.started = now
+                    job.claim_token = claim_token
+                    job.claim_count += 1
+                    job.lease_expires = lease_expires
+                    job.heartbeat = now
+
+                    return job
+
+def report_job_max_claims():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_REPORT_JOB_MAX_CLAIMS
+    except AttributeError:
+        pass
+
+    return 3
+
+def report_job_lease_duration():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_REPORT_JOB_LEASE_SECONDS
+    except AttributeError:
+        pass
+
+    return 15 * 60
+
 class ReportJob(models.Model):
+    class Meta: # pylint: disable=old-style-class, no-init, too-few-public-methods
+        indexes = [
+            # Matches ReportJobManager.claim_job: pending jobs only, in claim order.
+            pending_index(['requested', 'id'], Q(completed=None, failed=None), 'sde_report_job_pending'),
+        ]
+
     objects = ReportJobManager()
 
     requester = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -44,6 +151,7 @@ class ReportJob(models.Model):
     requested = models.DateTimeField(db_index=True)
     started = models.DateTimeField(db_index=True, null=True, blank=True)
     completed = models.DateTimeField(db_index=True, null=True, blank=True)
+    failed = models.DateTimeField(db_index=True, null=True, blank=True)
 
     job_index = models.IntegerField(default=1)
     job_count = models.IntegerField(default=1)
@@ -51,19 +159,60 @@ class ReportJob(models.Model):
     parameters = models.TextField(max_length=(32 * 1024 * 1024 * 1024), default='{}')
 
     report = models.FileField(upload_to=SIMPLE_DATA_EXPORT_FILE_FOLDER, null=True, blank=True)
+    report_size = models.BigIntegerField(null=True, blank=True)
+
+    claim_token = models.CharField(max_length=64, null=True, blank=True)
+    claim_count = models.IntegerField(default=0)
+    lease_expires = models.DateTimeField(db_index=True, null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    batch_request = models.ForeignKey('ReportJobBatchRequest', related_name='jobs', null=True, blank=True, on_delete=models.SET_NULL)
 
     def get_absolute_url(self):
         return reverse('simple_data_export_download_report', args=[self.pk])
 
+    def renew_lease(self):
+        now = timezone.now()
+        lease_expires = now + datetime.timedelta(seconds=report_job_lease_duration())
+
+        renewed = ReportJob.objects.filter(pk=self.pk, completed=None, claim_token=self.claim_token)\
+                                   .update(lease_expires=lease_expires, heartbeat=now)
+
+        if renewed == 1:
+            self.lease_expires = lease_expires
+            self.heartbeat = now
+
+            return True
+
+        return False
+
+    def complete(self):
+        # Records the saved report only while this worker still holds the claim. Returns False once the job was
+        # reclaimed (or marked failed) by another worker, in which case the caller must discard its output.
+
+        now = timezone.now()
+
+        completed = ReportJob.objects.filter(pk=self.pk, completed=None, failed=None, claim_token=self.claim_token)\
+                                     .update(completed=now, report=self.report.name, report_size=self.report_size)
+
+        if completed == 1:
+            self.completed = now
+
+            return True
+
+        return False
+
 @receiver(post_delete, sender=ReportJob)
 def report_job_post_delete_handler(sender, **kwargs): # pylint: disable=unused-argument
     job = kwargs['instance']
 
-    try:
-        storage, path = job.report.storage, job.report.path
-        storage.delete(path)
-    except ValueError:
-        pass
+    # Deleting by name (not local path) also removes reports kept in remote storage backends. Files are kept
+    # until the deletion commits, so a rolled back prune does not leave jobs without their reports.
+
+    if job.report:
+        storage, name = job.report.storage, job.report.name
+
+        transaction.on_commit(lambda: storage.delete(name))
 
 @register()
 def check_reports_upload_protected(app_configs, **kwargs): # pylint: disable=unused-argument
@@ -142,17 +291,81 @@ class ReportDestination(models.Model):
         self.save()
 
     def transmit(self, file_path, report):
-        for app in settings.INSTALLED_APPS:
-            try:
-                export_api = importlib.import_module(app + '.simple_data_export_api')
+        # True if any app sent the report, False if an app tried and failed, None if no app reported back.
+
+        transmitted = None
+
+        for export_api in fetch_export_apis('send_to_destination'):
+            result = export_api.send_to_destination(self, file_path, report)
+
+            if result is True:
+                transmitted = True
+            elif result is False and transmitted is None:
+                transmitted = False
+
+        return transmitted
+
+def estimate_export_cost(data_source, data_types, start_time, end_time):
+    # Sums the estimates of apps implementing estimate_export_cost. None if no app can estimate the source.
+
+    cost = None
+
+    for export_api in fetch_export_apis('estimate_export_cost'):
+        estimate = export_api.estimate_export_cost(data_source, data_types, start_time, end_time)
+
+        if estimate is not None:
+            cost = estimate if cost is None else (cost + estimate)
+
+    return cost
+
+def partition_data_sources(sources, data_types, start_time, end_time, sources_per_job):
+    # Splits sources into as many jobs as fixed chunks of sources_per_job would produce. When exporters
+    # estimate costs, sources are packed largest first into the cheapest job so far (LPT scheduling),
+    # so that jobs running in parallel finish together. Sources without estimates count as the mean cost.
+
+    job_count = int(math.ceil(float(len(sources)) / sources_per_job))
+
+    if job_count < 2 or not fetch_export_apis('estimate_export_cost'):
+        return [sources[index:(index + sources_per_job)] for index in range(0, len(sources), sources_per_job)]
+
+    if start_time:
+        start_time = arrow.get(start_time).datetime
+
+    if end_time:
+        end_time = arrow.get(end_time).datetime
+
+    costs = [estimate_export_cost(source, data_types, start_time, end_time) for source in sources]
+
+    known_costs = [cost for cost in costs if cost is not None]
+
+    if not known_costs:
+        return [sources[index:(index + sources_per_job)] for index in range(0, len(sources), sources_per_job)]
+
+    mean_cost = float(sum(known_costs)) / len(known_costs)
+
+    costs = [(mean_cost if cost is None else cost) for cost in costs]
 
-                export_api.send_to_destination(self, file_path, report)
-            except ImportError:
-                pass
-            except AttributeError:
-                pass
+    jobs = [(0, job_index, []) for job_index in range(job_count)]
+
+    for source_index in sorted(range(len(sources)), key=lambda index: -costs[index]):
+        job_cost, job_index, job_sources = heapq.heappop(jobs)
+
+        job_sources.append(source_index)
+
+        heapq.heappush(jobs, (job_cost + costs[source_index], job_index, job_sources))
+
+    # Keep the category & name order within & across jobs.
+
+    partitions = sorted((sorted(job_sources) for _, _, job_sources in jobs if job_sources), key=lambda job_sources: job_sources[0])
+
+    return [[sources[index] for index in job_sources] for job_sources in partitions]
 
 class ReportJobBatchRequest(models.Model):
+    class Meta: # pylint: disable=old-style-class, no-init, too-few-public-methods
+        indexes = [
+            pending_index(['requested', 'id'], Q(started=None, completed=None), 'sde_batch_request_pending'),
+        ]
+
     requester = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
     requested = models.DateTimeField(db_index=True)
@@ -161,33 +374,50 @@ class ReportJobBatchRequest(models.Model):
 
     parameters = models.TextField(max_length=(32 * 1024 * 1024 * 1024)) # pylint: disable=superfluous-parens
 
-    def process(self): # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-        self.started = timezone.now()
-        self.save()
+    def process(self):
+        # Returns False if another worker claimed the request first. The claim is released if the request
+        # cannot be expanded, so that a later run retries it.
+
+        now = timezone.now()
+
+        claimed = ReportJobBatchRequest.objects.filter(pk=self.pk, started=None, completed=None).update(started=now)
+
+        if claimed == 0:
+            return False
+
+        self.started = now
+
+        expanded = False
+
+        try:
+            self.expand()
+
+            expanded = True
+        finally:
+            if expanded is False:
+                ReportJobBatchRequest.objects.filter(pk=self.pk, completed=None).update(started=None)
+
+                self.started = None
+
+        return True
 
+    def expand(self): # pylint: disable=too-many-locals, too-many-branches, too-many-statements
         params = json.loads(self.parameters)
 
         sources = []
 
         if ('data_sources' in params) is False:
-            for app in settings.INSTALLED_APPS:
-                try:
-                    export_api = importlib.import_module(app + '.simple_data_export_api')
-
-                    export_sources = export_api.export_data_sources(params)
+            for export_api in fetch_export_apis('export_data_sources'):
+                export_sources = export_api.export_data_sources(params)
 
-                    for new_source in export_sources:
-                        identifier = new_source
+                for new_source in export_sources:
+                    identifier = new_source
 
-                        if isinstance(new_source, str):
-                            identifier = (new_source, new_source, 'Uncategorized Exports')
+                    if isinstance(new_source, str):
+                        identifier = (new_source, new_source, 'Uncategorized Exports')
 
-                        if (identifier in sources) is False:
-                            sources.append(identifier)
-                except ImportError:
-                    pass
-                except AttributeError:
-                    pass
+                    if (identifier in sources) is False:
+                        sources.append(identifier)
         else:
             sources.extend(params['data_sources'])
 
@@ -204,13 +434,7 @@ class ReportJobBatchRequest(models.Model):
         except AttributeError:
             pass
 
-        source_index = 0
-
-        while source_index < len(sources):
-            pending_sources = sources[source_index:(source_index + sources_per_job)]
-
-            job = ReportJob(requester=self.requester, requested=requested)
-
+        for pending_sources in partition_data_sources(sources, params['data_types'], params['start_time'], params['end_time'], sources_per_job):
             job_params = {}
 
             job_params['data_sources'] = pending_sources
@@ -218,22 +442,547 @@ class ReportJobBatchRequest(models.Model):
             job_params['start_time'] = params['start_time']
             job_params['end_time'] = params['end_time']
             job_params['custom_parameters'] = params['custom_parameters']
+            job_params['incremental'] = params.get('incremental', False)
 
-            job.parameters = json.dumps(job_params, indent=2)
-            job.save()
+            if 'destinations' in params:
+                job_params['destinations'] = params['destinations']
 
-            pending_jobs.append(job)
+            pending_jobs.append(ReportJob(requester=self.requester, requested=requested, batch_request=self, parameters=json.dumps(job_params, indent=2)))
 
-            source_index += sources_per_job
+        for index, job in enumerate(pending_jobs):
+            job.job_index = index + 1
+            job.job_count = len(pending_jobs)
 
-        index = 1
+        # Jobs become visible to workers all at once, with their final index & count, or not at all.
 
-        for job in pending_jobs:
-            job.job_index = index
-            job.job_count = len(pending_jobs)
-            job.save()
+        with transaction.atomic():
+            ReportJob.objects.bulk_create(pending_jobs)
+
+            self.completed = timezone.now()
+            self.save()
+
+def data_source_identifier(data_source):
+    # Data sources are either identifiers or (identifier, name, category) sequences.
+
+    if isinstance(data_source, (list, tuple)):
+        return data_source[0]
+
+    return data_source
+
+class ReportCursorManager(models.Manager):
+    def fetch_since(self, requester, data_sources, data_type):
+        # Maps each data source identifier to its high-water mark, or None if it has never been exported.
+
+        identifiers = [data_source_identifier(data_source) for data_source in data_sources]
+
+        since = dict((identifier, None) for identifier in identifiers)
+
+        for cursor in self.filter(requester=requester, data_type=data_type, data_source__in=identifiers):
+            since[cursor.data_source] = cursor.high_water
+
+        return since
+
+    def advance(self, requester, data_sources, data_types, high_water):
+        now = timezone.now()
+
+        identifiers = [data_source_identifier(data_source) for data_source in data_sources]
+
+        with transaction.atomic(using=self.db):
+            for data_type in data_types:
+                existing = set(self.filter(requester=requester, data_type=data_type, data_source__in=identifiers).values_list('data_source', flat=True))
+
+                # High-water marks only move forward, so back-filling an older window leaves cursors alone.
+
+                self.filter(requester=requester, data_type=data_type, data_source__in=existing, high_water__lt=high_water)\
+                    .update(high_water=high_water, updated=now)
+
+                missing = [identifier for identifier in identifiers if (identifier in existing) is False]
+
+                if getattr(connections[self.db].features, 'supports_ignore_conflicts', False): # Django 2.2+
+                    self.bulk_create([ReportCursor(requester=requester, data_source=identifier, data_type=data_type, high_water=high_water, updated=now) for identifier in missing], ignore_conflicts=True)
+                else:
+                    for identifier in missing:
+                        self.get_or_create(requester=requester, data_source=identifier, data_type=data_type, defaults={'high_water': high_water, 'updated': now})
+
+class ReportCursor(models.Model):
+    class Meta: # pylint: disable=old-style-class, no-init, too-few-public-methods
+        unique_together = (('requester', 'data_source', 'data_type'),)
+
+    objects = ReportCursorManager()
+
+    requester = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='simple_data_export_cursors', on_delete=models.CASCADE)
+
+    data_source = models.CharField(max_length=1024, db_index=True)
+    data_type = models.CharField(max_length=1024, db_index=True)
+
+    high_water = models.DateTimeField(db_index=True)
+    updated = models.DateTimeField()
+
+class ReportTransmissionManager(models.Manager): # pylint: disable=too-few-public-methods
+    def enqueue(self, report, destinations=None):
+        now = timezone.now()
+
+        report_destinations = ReportDestination.objects.filter(user=report.requester)
+
+        if destinations is not None:
+            report_destinations = report_destinations.filter(pk__in=destinations)
+
+        for destination in report_destinations:
+            self.create(job=report, destination=destination, created=now, next_attempt=now)
+
+    def claim_transmission(self, lease_seconds):
+        while True:
+            with transaction.atomic(using=self.db):
+                now = timezone.now()
+
+                pending = self.filter(transmitted=None, failed=None, next_attempt__lte=now)
+
+                if connections[self.db].features.has_select_for_update_skip_locked:
+                    pending = pending.select_for_update(skip_locked=True)
+
+                transmission = pending.order_by('next_attempt', 'pk').first()
+
+                if transmission is None:
+                    return None
+
+                # Pushing next_attempt past the upload timeout leases the transmission to this worker.
+                # If the worker dies, the transmission becomes due again once the lease lapses.
+
+                next_attempt = now + datetime.timedelta(seconds=lease_seconds)
+
+                claimed = self.filter(pk=transmission.pk, next_attempt=transmission.next_attempt)\
+                              .update(next_attempt=next_attempt, last_attempt=now, attempts=(F('attempts') + 1))
+
+                if claimed == 1:
+                    transmission.next_attempt = next_attempt
+                    transmission.last_attempt = now
+                    transmission.attempts += 1
+
+                    return transmission
+
+class ReportTransmission(models.Model):
+    class Meta: # pylint: disable=old-style-class, no-init, too-few-public-methods
+        indexes = [
+            # Matches ReportTransmissionManager.claim_transmission.
+            pending_index(['next_attempt', 'id'], Q(transmitted=None, failed=None), 'sde_transmission_pending'),
+        ]
+
+    objects = ReportTransmissionManager()
+
+    job = models.ForeignKey(ReportJob, related_name='transmissions', on_delete=models.CASCADE)
+    destination = models.ForeignKey(ReportDestination, related_name='transmissions', on_delete=models.CASCADE)
+
+    created = models.DateTimeField(db_index=True)
+    next_attempt = models.DateTimeField(db_index=True, null=True, blank=True)
+    last_attempt = models.DateTimeField(null=True, blank=True)
+    transmitted = models.DateTimeField(db_index=True, null=True, blank=True)
+    failed = models.DateTimeField(db_index=True, null=True, blank=True)
+
+    attempts = models.IntegerField(default=0)
+
+    last_error = models.TextField(max_length=(1024 * 1024), null=True, blank=True)
+
+    def send(self):
+        # Uploads the report without recording the outcome. See ReportDestination.transmit for return values.
+
+        try:
+            file_path = self.job.report.path
+        except NotImplementedError: # Storage without local paths.
+            file_path = None
+
+        if file_path is not None:
+            return self.destination.transmit(file_path, self.job)
+
+        # Destinations expect a local file, so transmit a temporary copy under the report's file name.
+
+        local_directory = tempfile.mkdtemp()
 
-            index += 1
+        try:
+            file_path = os.path.join(local_directory, os.path.basename(self.job.report.name))
+
+            self.job.report.open('rb')
+
+            try:
+                with open(file_path, 'wb') as local_copy:
+                    shutil.copyfileobj(self.job.report, local_copy)
+            finally:
+                self.job.report.close()
+
+            return self.destination.transmit(file_path, self.job)
+        finally:
+            shutil.rmtree(local_directory, ignore_errors=True)
+
+    def transmit(self):
+        transmitted = self.send()
+
+        self.record_outcome(transmitted)
+
+        return transmitted
+
+    def record_outcome(self, transmitted):
+        if transmitted is True:
+            return self.record_success()
+
+        if transmitted is False:
+            return self.record_failure('Unable to transmit report to destination "%s". See logs for details.' % self.destination.destination)
+
+        # No app handles this destination - surface it in the admin instead of reporting success.
+
+        return self.record_failure('No installed app transmitted report to destination "%s". Check its destination type & configuration.' % self.destination.destination)
+
+    def update_claimed(self, **fields):
+        # Writes the outcome of this attempt only while it is still the latest claim. A worker that lost its
+        # lease (or a timed out upload that finished late) must not overwrite the outcome of a newer attempt.
+
+        updated = ReportTransmission.objects.filter(pk=self.pk, transmitted=None, failed=None, attempts=self.attempts, last_attempt=self.last_attempt)\
+                                            .update(**fields)
+
+        if updated == 1:
+            for field, value in fields.items():
+                setattr(self, field, value)
+
+            return True
+
+        return False
+
+    def record_success(self):
+        return self.update_claimed(transmitted=timezone.now(), next_attempt=None, last_error=None)
+
+    def record_failure(self, error):
+        max_attempts = 8
+
+        try:
+            max_attempts = settings.SIMPLE_DATA_EXPORT_TRANSMISSION_MAX_ATTEMPTS
+        except AttributeError:
+            pass
+
+        if self.attempts >= max_attempts:
+            return self.update_claimed(failed=timezone.now(), next_attempt=None, last_error=error)
+
+        backoff = 60
+        max_backoff = 6 * 60 * 60
+
+        try:
+            backoff = settings.SIMPLE_DATA_EXPORT_TRANSMISSION_BACKOFF
+        except AttributeError:
+            pass
+
+        try:
+            max_backoff = settings.SIMPLE_DATA_EXPORT_TRANSMISSION_MAX_BACKOFF
+        except AttributeError:
+            pass
+
+        delay = min(backoff * (2 ** (self.attempts - 1)), max_backoff)
+
+        return self.update_claimed(next_attempt=(timezone.now() + datetime.timedelta(seconds=delay)), last_error=error)
+
+class ReportScheduleManager(models.Manager): # pylint: disable=too-few-public-methods
+    def claim_schedule(self):
+        while True:
+            with transaction.atomic(using=self.db):
+                now = timezone.now()
+
+                due = self.filter(active=True, next_run__lte=now)
+
+                if connections[self.db].features.has_select_for_update_skip_locked:
+                    due = due.select_for_update(skip_locked=True)
+
+                schedule = due.order_by('next_run', 'pk').first()
+
+                if schedule is None:
+                    return None
+
+                scheduled = schedule.next_run
+
+                # Conditional update guards backends without row-level locks against concurrent claims.
+
+                try:
+                    next_run = schedule.fetch_next_run(now)
+                except ValueError:
+                    next_run = None # Invalid cron expressions stop the schedule until corrected.
+
+                claimed = self.filter(pk=schedule.pk, next_run=scheduled)\
+                              .update(next_run=next_run, last_run=now)
+
+                if claimed == 1:
+                    schedule.refresh_from_db()
+
+                    return (schedule, scheduled)
+
+def report_schedule_stale_seconds():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_SCHEDULE_STALE_SECONDS
+    except AttributeError:
+        pass
+
+    return 24 * 60 * 60
+
+class ReportSchedule(models.Model):
+    objects = ReportScheduleManager()
+
+    requester = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='simple_data_export_schedules', on_delete=models.CASCADE)
+
+    name = models.CharField(max_length=1024)
+    active = models.BooleanField(default=True)
+
+    schedule = models.CharField(max_length=1024, help_text='Cron expression (minute, hour, day of month, month, day of week) in the site time zone.')
+    jitter = models.IntegerField(default=300, help_text='Maximum seconds added to each run to spread out schedules sharing a cron expression.')
+    lookback = models.IntegerField(null=True, blank=True, help_text='Seconds of data exported before each run. Leave blank for all history.')
+
+    data_sources = models.TextField(max_length=(32 * 1024 * 1024 * 1024), null=True, blank=True, help_text='JSON list of data sources. Leave blank for all data sources.')
+    data_types = models.TextField(max_length=(32 * 1024 * 1024 * 1024), default='[]', help_text='JSON list of data types.')
+    custom_parameters = models.TextField(max_length=(32 * 1024 * 1024 * 1024), default='{}')
+
+    incremental = models.BooleanField(default=False)
+
+    destinations = models.ManyToManyField(ReportDestination, related_name='schedules', blank=True, help_text='Leave blank for all of the requester\'s destinations.')
+
+    next_run = models.DateTimeField(db_index=True, null=True, blank=True)
+    last_run = models.DateTimeField(null=True, blank=True)
+    last_batch = models.ForeignKey(ReportJobBatchRequest, related_name='schedules', null=True, blank=True, on_delete=models.SET_NULL)
+
+    def clean(self):
+        errors = {}
+
+        try:
+            next_cron_time(self.schedule, datetime.datetime.now())
+        except ValueError as exception:
+            errors['schedule'] = str(exception)
+
+        for field in ('data_sources', 'data_types', 'custom_parameters'):
+            value = getattr(self, field)
+
+            if value is not None and value.strip() != '':
+                try:
+                    json.loads(value)
+                except ValueError as exception:
+                    errors[field] = 'Invalid JSON: %s' % exception
+
+        if errors:
+            raise ValidationError(errors)
+
+    def jitter_offset(self):
+        # Stable per schedule, so that runs stay evenly spaced while schedules sharing a cron expression spread out.
+
+        if self.jitter is None or self.jitter <= 0:
+            return 0
+
+        return int(hashlib.sha256(('%s' % self.pk).encode('utf-8')).hexdigest(), 16) % (self.jitter + 1)
+
+    def fetch_next_run(self, after=None):
+        if after is None:
+            after = timezone.now()
+
+        here_tz = pytz.timezone(settings.TIME_ZONE)
+
+        # Cron times are matched against the site's wall clock. Subtracting the jitter keeps a run that
+        # just started from matching its own cron time again.
+
+        after = (after - datetime.timedelta(seconds=self.jitter_offset())).astimezone(here_tz).replace(tzinfo=None)
 
-        self.completed = timezone.now()
+        next_run = here_tz.localize(next_cron_time(self.schedule, after))
+
+        return next_run + datetime.timedelta(seconds=self.jitter_offset())
+
+    def is_unfinished(self):
+        if self.last_batch is None:
+            return False
+
+        if self.last_batch.completed is None:
+            return True
+
+        return self.last_batch.jobs.filter(completed=None, failed=None).exists()
+
+    def is_stale(self):
+        # Runs unfinished after SIMPLE_DATA_EXPORT_SCHEDULE_STALE_SECONDS are presumed dead, so that a failed
+        # batch does not block the schedule forever.
+
+        if self.last_batch is None:
+            return False
+
+        return self.last_batch.requested < timezone.now() - datetime.timedelta(seconds=report_schedule_stale_seconds())
+
+    def is_running(self):
+        return self.is_unfinished() and self.is_stale() is False
+
+    def run(self, scheduled):
+        # Creates a batch request covering the lookback window that ends at the (unjittered) scheduled time.
+
+        end_time = scheduled - datetime.timedelta(seconds=self.jitter_offset())
+
+        start_time = None
+
+        if self.lookback is not None:
+            start_time = (end_time - datetime.timedelta(seconds=self.lookback)).isoformat()
+
+        data_sources = None
+
+        if self.data_sources is not None and self.data_sources.strip() != '':
+            data_sources = json.loads(self.data_sources)
+
+        destinations = list(self.destinations.values_list('pk', flat=True))
+
+        if not destinations:
+            destinations = None
+
+        self.last_batch = ReportJob.objects.create_jobs(self.requester, data_sources, json.loads(self.data_types), start_time=start_time, end_time=end_time.isoformat(), custom_parameters=json.loads(self.custom_parameters), incremental=self.incremental, destinations=destinations)
         self.save()
+
+        return self.last_batch
+
+def retention_setting(name, default=None):
+    try:
+        return getattr(settings, 'SIMPLE_DATA_EXPORT_RETENTION_' + name)
+    except AttributeError:
+        pass
+
+    return default
+
+class ReportJobArchiveManager(models.Manager): # pylint: disable=too-few-public-methods
+    def archive_jobs(self, jobs):
+        now = timezone.now()
+
+        archives = []
+
+        for job in jobs:
+            parameters = json.loads(job.parameters)
+
+            start_time = parameters.get('start_time', None)
+            end_time = parameters.get('end_time', None)
+
+            archives.append(ReportJobArchive(job_id=job.pk,
+                                             requester_id=job.requester_id,
+                                             requested=job.requested,
+                                             started=job.started,
+                                             completed=job.completed,
+                                             failed=job.failed,
+                                             job_index=job.job_index,
+                                             job_count=job.job_count,
+                                             data_types=json.dumps(parameters.get('data_types', [])),
+                                             data_source_count=len(parameters.get('data_sources', [])),
+                                             start_time=(arrow.get(start_time).datetime if start_time else None),
+                                             end_time=(arrow.get(end_time).datetime if end_time else None),
+                                             report_name=(job.report.name if job.report else None),
+                                             report_size=job.report_size,
+                                             archived=now))
+
+        self.bulk_create(archives)
+
+class ReportJobArchive(models.Model):
+    # Compact record of a pruned report job. Data source lists & custom parameters are not kept.
+
+    objects = ReportJobArchiveManager()
+
+    job_id = models.IntegerField(db_index=True)
+
+    requester = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='simple_data_export_archived_jobs', on_delete=models.CASCADE)
+
+    requested = models.DateTimeField(db_index=True)
+    started = models.DateTimeField(null=True, blank=True)
+    completed = models.DateTimeField(db_index=True, null=True, blank=True)
+    failed = models.DateTimeField(db_index=True, null=True, blank=True)
+
+    job_index = models.IntegerField(default=1)
+    job_count = models.IntegerField(default=1)
+
+    data_types = models.TextField(max_length=(1024 * 1024), default='[]')
+    data_source_count = models.IntegerField(default=0)
+
+    start_time = models.DateTimeField(null=True, blank=True)
+    end_time = models.DateTimeField(null=True, blank=True)
+
+    report_name = models.CharField(max_length=1024, null=True, blank=True)
+    report_size = models.BigIntegerField(null=True, blank=True)
+
+    archived = models.DateTimeField(db_index=True)
+
+def expired_report_job_ids(now=None):
+    # Completed jobs outside the retention policy: older than SIMPLE_DATA_EXPORT_RETENTION_DAYS, or beyond the
+    # newest SIMPLE_DATA_EXPORT_RETENTION_MAX_REPORTS or SIMPLE_DATA_EXPORT_RETENTION_MAX_BYTES per requester.
+    # Jobs with transmissions still pending are kept until they are sent or fail. Failed jobs are aged by the
+    # time they failed & counted separately, so they never displace completed reports.
+
+    if now is None:
+        now = timezone.now()
+
+    max_days = retention_setting('DAYS')
+    max_reports = retention_setting('MAX_REPORTS')
+    max_bytes = retention_setting('MAX_BYTES')
+
+    pending_transmissions = ReportTransmission.objects.filter(transmitted=None, failed=None).values('job_id')
+
+    completed = ReportJob.objects.exclude(completed=None).exclude(pk__in=pending_transmissions)
+    failed = ReportJob.objects.filter(completed=None).exclude(failed=None)
+
+    expired = set()
+
+    if max_days is not None:
+        expired.update(completed.filter(completed__lt=(now - datetime.timedelta(days=max_days))).values_list('pk', flat=True))
+        expired.update(failed.filter(failed__lt=(now - datetime.timedelta(days=max_days))).values_list('pk', flat=True))
+
+    if max_reports is not None:
+        for requester_id in failed.order_by().values_list('requester_id', flat=True).distinct():
+            expired.update(failed.filter(requester_id=requester_id).order_by('-failed', '-pk').values_list('pk', flat=True)[max_reports:])
+
+    if max_reports is None and max_bytes is None:
+        return sorted(expired)
+
+    if max_bytes is not None: # Sizes of reports compiled before report_size was recorded.
+        for job in completed.filter(report_size=None).exclude(report='').exclude(report=None).iterator():
+            try:
+                report_size = job.report.size
+            except OSError:
+                report_size = 0
+
+            ReportJob.objects.filter(pk=job.pk).update(report_size=report_size)
+
+    for requester_id in completed.order_by().values_list('requester_id', flat=True).distinct():
+        retained = 0
+        retained_bytes = 0
+
+        for job_id, report_size in completed.filter(requester_id=requester_id).order_by('-completed', '-pk').values_list('pk', 'report_size').iterator():
+            retained += 1
+            retained_bytes += report_size or 0
+
+            if (max_reports is not None and retained > max_reports) or (max_bytes is not None and retained_bytes > max_bytes):
+                expired.add(job_id)
+
+    return sorted(expired)
+
+def prune_report_jobs(now=None, archive=None, batch_size=None):
+    # Deletes expired jobs & their report files in batches, optionally archiving their metadata first.
+
+    if archive is None:
+        archive = retention_setting('ARCHIVE', False)
+
+    if batch_size is None:
+        batch_size = retention_setting('BATCH_SIZE', 500)
+
+    expired = expired_report_job_ids(now)
+
+    pruned = 0
+
+    for index in range(0, len(expired), batch_size):
+        with transaction.atomic():
+            jobs = list(ReportJob.objects.filter(pk__in=expired[index:(index + batch_size)]))
+
+            if archive:
+                ReportJobArchive.objects.archive_jobs(jobs)
+
+            # Report files are removed by report_job_post_delete_handler.
+
+            ReportJob.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+
+            pruned += len(jobs)
+
+    max_days = retention_setting('DAYS')
+
+    if max_days is not None: # Batch requests whose jobs have all been pruned.
+        if now is None:
+            now = timezone.now()
+
+        ReportJobBatchRequest.objects.exclude(completed=None)\
+                                     .filter(completed__lt=(now - datetime.timedelta(days=max_days)), jobs=None)\
+                                     .delete()
+
+    return pruned
@@ -1,4 +1,7 @@
 def quicksilver_tasks():
     return [
         ('simple_data_export_compile_reports', '--no-color', 60, 'data-export'),
+        ('simple_data_export_transmit_reports', '--no-color', 60, 'data-export-transmit'),
+        ('simple_data_export_schedule_reports', '--no-color', 60, 'data-export-schedule'),
+        ('simple_data_export_prune_reports', '--no-color', 60 * 60, 'data-export-prune'),
     ]
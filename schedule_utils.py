@@ -0,0 +1,102 @@
+# pylint: disable=line-too-long
+
+import datetime
+
+CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7), # 0 & 7 = Sunday, as in cron.
+)
+
+CRON_SEARCH_DAYS = 366 * 5
+
+def parse_cron_field(value, name, minimum, maximum):
+    values = set()
+
+    for part in value.split(','):
+        step = 1
+
+        if '/' in part:
+            part, step = part.split('/', 1)
+
+            step = int(step)
+
+            if step < 1:
+                raise ValueError('Invalid step in cron %s field: "%s".' % (name, value))
+
+        if part == '*':
+            start, end = minimum, maximum
+        elif '-' in part:
+            start, end = [int(bound) for bound in part.split('-', 1)]
+        else:
+            start = int(part)
+            end = maximum if step > 1 else start
+
+        if start < minimum or end > maximum or start > end:
+            raise ValueError('Out of range value in cron %s field: "%s".' % (name, value))
+
+        values.update(range(start, end + 1, step))
+
+    if name == 'weekday':
+        values = set(weekday % 7 for weekday in values)
+
+    return frozenset(values)
+
+def parse_cron(expression):
+    # Parses a standard five field cron expression (minute, hour, day of month, month, day of week),
+    # supporting "*", lists, ranges & steps. Returns a tuple of sets & whether the day fields are restricted.
+
+    fields = expression.split()
+
+    if len(fields) != len(CRON_FIELDS):
+        raise ValueError('Cron expression "%s" must have %s fields.' % (expression, len(CRON_FIELDS)))
+
+    try:
+        parsed = tuple(parse_cron_field(value, name, minimum, maximum) for value, (name, minimum, maximum) in zip(fields, CRON_FIELDS))
+    except ValueError as exception:
+        raise ValueError('Invalid cron expression "%s": %s' % (expression, exception)) # pylint: disable=raise-missing-from
+
+    return parsed + (fields[2] != '*', fields[4] != '*')
+
+def cron_day_matches(parsed, day):
+    minutes, hours, days, months, weekdays, days_restricted, weekdays_restricted = parsed # pylint: disable=unused-variable
+
+    if (day.month in months) is False:
+        return False
+
+    day_match = day.day in days
+    weekday_match = ((day.weekday() + 1) % 7) in weekdays
+
+    # As in cron, a restricted day of month & day of week match if either does.
+
+    if days_restricted and weekdays_restricted:
+        return day_match or weekday_match
+
+    return day_match and weekday_match
+
+def next_cron_time(expression, after):
+    # Returns the first naive datetime strictly after the naive datetime "after" that matches the expression.
+
+    parsed = parse_cron(expression)
+
+    minutes = sorted(parsed[0])
+    hours = sorted(parsed[1])
+
+    after = after.replace(second=0, microsecond=0)
+
+    day = after.date()
+
+    for _ in range(CRON_SEARCH_DAYS):
+        if cron_day_matches(parsed, day):
+            for hour in hours:
+                for minute in minutes:
+                    candidate = datetime.datetime.combine(day, datetime.time(hour, minute))
+
+                    if candidate > after:
+                        return candidate
+
+        day = day + datetime.timedelta(days=1)
+
+    raise ValueError('Cron expression "%s" does not match any time in the next %s days.' % (expression, CRON_SEARCH_DAYS))
@@ -2,11 +2,15 @@
 
 from __future__ import print_function
 
+import atexit
+import contextlib
+import hashlib
 import io
 import json
 import logging
 import os
 import shutil
+import threading
 import time
 import traceback
 
@@ -15,22 +19,203 @@ import dropbox
 import paramiko
 import pytz
 
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 
 from django.conf import settings
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
+S3_MINIMUM_PART_SIZE = 5 * 1024 * 1024
+
+def upload_chunk_size():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_UPLOAD_CHUNK_SIZE
+    except AttributeError:
+        pass
+
+    return 8 * 1024 * 1024
+
+def upload_concurrency():
+    try:
+        return settings.SIMPLE_DATA_EXPORT_UPLOAD_CONCURRENCY
+    except AttributeError:
+        pass
+
+    return 4
+
+CACHED_PRIVATE_KEYS = {}
+
+SFTP_SESSIONS = {}
+SFTP_SESSIONS_LOCK = threading.Lock()
+
+def load_private_key(key_text):
+    key_hash = hashlib.sha256(key_text.encode('utf-8')).hexdigest()
+
+    with SFTP_SESSIONS_LOCK:
+        if key_hash in CACHED_PRIVATE_KEYS:
+            return CACHED_PRIVATE_KEYS[key_hash]
+
+    key = paramiko.RSAKey.from_private_key(io.StringIO(key_text))
+
+    with SFTP_SESSIONS_LOCK:
+        CACHED_PRIVATE_KEYS[key_hash] = key
+
+    return key
+
+def open_sftp_session(host, username, key):
+    ssh_client = paramiko.SSHClient()
+
+    trust_host_keys = True
+
+    try:
+        trust_host_keys = settings.SIMPLE_DATA_EXPORT_TRUST_HOST_KEYS
+    except AttributeError:
+        pass
+
+    if trust_host_keys:
+        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy()) # nosec
+
+    keepalive = 30
+
+    try:
+        keepalive = settings.SIMPLE_DATA_EXPORT_SFTP_KEEPALIVE
+    except AttributeError:
+        pass
+
+    try:
+        ssh_client.connect(hostname=host, username=username, pkey=key, timeout=60)
+
+        ssh_client.get_transport().set_keepalive(keepalive)
+
+        return (ssh_client, ssh_client.open_sftp())
+    except:
+        ssh_client.close()
+
+        raise
+
+def close_sftp_session(session):
+    ssh_client, ftp_client = session
+
+    try:
+        ftp_client.close()
+    finally:
+        ssh_client.close()
+
+@contextlib.contextmanager
+def sftp_session(host, username, key_text):
+    # Checks out an idle SFTP session for this host & identity (or opens a new one) and returns it
+    # to the pool afterwards. Sessions are not shared between threads while checked out.
+
+    key = load_private_key(key_text)
+
+    pool_key = (host, username, key.get_fingerprint())
+
+    session = None
+
+    with SFTP_SESSIONS_LOCK:
+        idle_sessions = SFTP_SESSIONS.setdefault(pool_key, [])
+
+        while idle_sessions and session is None:
+            session = idle_sessions.pop()
+
+            transport = session[0].get_transport()
+
+            if transport is None or transport.is_active() is False:
+                close_sftp_session(session)
+
+                session = None
+
+    if session is None:
+        session = open_sftp_session(host, username, key)
+
+    try:
+        yield session[1]
+    except:
+        close_sftp_session(session) # Do not reuse sessions in an unknown state.
+
+        raise
+
+    with SFTP_SESSIONS_LOCK:
+        SFTP_SESSIONS.setdefault(pool_key, []).append(session)
+
+def close_sftp_sessions():
+    with SFTP_SESSIONS_LOCK:
+        for idle_sessions in SFTP_SESSIONS.values():
+            while idle_sessions:
+                try:
+                    close_sftp_session(idle_sessions.pop())
+                except: # pylint: disable=bare-except
+                    traceback.print_exc()
+
+atexit.register(close_sftp_sessions)
+
+S3_CLIENTS = {}
+S3_CLIENTS_LOCK = threading.Lock()
+
+def fetch_s3_client(region, access_key_id, secret_access_key):
+    # Clients are thread-safe once built, but boto3 session & client construction is not.
+
+    client_key = (region, access_key_id, hashlib.sha256(secret_access_key.encode('utf-8')).hexdigest())
+
+    with S3_CLIENTS_LOCK:
+        if (client_key in S3_CLIENTS) is False:
+            max_pool_connections = max(10, upload_concurrency())
+
+            try:
+                max_pool_connections = settings.SIMPLE_DATA_EXPORT_S3_MAX_POOL_CONNECTIONS
+            except AttributeError:
+                pass
+
+            aws_config = Config(
+                region_name=region,
+                retries={'max_attempts': 10, 'mode': 'standard'},
+                max_pool_connections=max_pool_connections
+            )
+
+            session = boto3.session.Session(aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key, region_name=region)
+
+            S3_CLIENTS[client_key] = session.client('s3', config=aws_config)
+
+        return S3_CLIENTS[client_key]
+
+def upload_to_dropbox(client, report_path, path):
+    chunk_size = upload_chunk_size()
+
+    file_size = os.path.getsize(report_path)
+
+    with io.open(report_path, 'rb') as report_file:
+        if file_size <= chunk_size:
+            client.files_upload(report_file.read(), path)
+
+            return
+
+        # Larger reports go up through an upload session, one chunk in memory at a time.
+
+        session = client.files_upload_session_start(report_file.read(chunk_size))
+
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=report_file.tell())
+        commit = dropbox.files.CommitInfo(path=path)
+
+        while (file_size - report_file.tell()) > chunk_size:
+            client.files_upload_session_append_v2(report_file.read(chunk_size), cursor)
+
+            cursor.offset = report_file.tell()
+
+        client.files_upload_session_finish(report_file.read(chunk_size), cursor, commit)
+
 def send_to_destination(destination, report_path, report): # pylint: disable=too-many-branches, too-many-statements, too-many-locals
     file_sent = False
 
     here_tz = pytz.timezone(settings.TIME_ZONE)
 
+    if (destination.destination in ('dropbox', 'sftp', 's3', 'local')) is False:
+        return None
+
+    # Retries with backoff are handled by the ReportTransmission queue, so attempt once by default.
+
     sleep_durations = [
         0,
-        60,
-        120,
-        300,
     ]
 
     try:
@@ -78,10 +263,11 @@ def send_to_destination(destination, report_path, report): # pylint: disable=too
                     time.sleep(duration)
 
                     try:
-                        with io.open(report_path, 'rb') as report_file:
-                            client.files_upload(report_file.read(), path)
+                        upload_to_dropbox(client, report_path, path)
+
+                        file_sent = True
 
-                            file_sent = True
+                        break
                     except: # pylint: disable=bare-except
                         if duration == sleep_durations[-1]:
                             logger.error('Unable to upload - error encountered. (Latest sleep = %s seconds.)', duration)
@@ -121,25 +307,8 @@ def send_to_destination(destination, report_path, report): # pylint: disable=too
                     time.sleep(duration)
 
                     try:
-                        key = paramiko.RSAKey.from_private_key(io.StringIO(parameters['key']))
-
-                        ssh_client = paramiko.SSHClient()
-
-                        trust_host_keys = True
-
-                        try:
-                            trust_host_keys = settings.SIMPLE_DATA_EXPORT_TRUST_HOST_KEYS
-                        except AttributeError:
-                            pass
-
-                        if trust_host_keys:
-                            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy()) # nosec
-
-                        ssh_client.connect(hostname=parameters['host'], username=parameters['username'], pkey=key)
-
-                        ftp_client = ssh_client.open_sftp()
-                        ftp_client.put(report_path, path)
-                        ftp_client.close()
+                        with sftp_session(parameters['host'], parameters['username'], parameters['key']) as ftp_client:
+                            ftp_client.put(report_path, path)
 
                         file_sent = True
 
@@ -154,15 +323,7 @@ def send_to_destination(destination, report_path, report): # pylint: disable=too
     elif destination.destination == 's3':
         try:
             if ('region' in parameters) and ('access_key_id' in parameters) and ('secret_access_key' in parameters) and ('bucket' in parameters):
-                aws_config = Config(
-                    region_name=parameters['region'],
-                    retries={'max_attempts': 10, 'mode': 'standard'}
-                )
-
-                os.environ['AWS_ACCESS_KEY_ID'] = parameters['access_key_id']
-                os.environ['AWS_SECRET_ACCESS_KEY'] = parameters['secret_access_key']
-
-                client = boto3.client('s3', config=aws_config)
+                client = fetch_s3_client(parameters['region'], parameters['access_key_id'], parameters['secret_access_key'])
 
                 s3_bucket = parameters['bucket']
 
@@ -192,10 +353,16 @@ def send_to_destination(destination, report_path, report): # pylint: disable=too
 
                 path = path + os.path.basename(os.path.normpath(report_path))
 
-                with io.open(report_path, 'rb') as report_file:
-                    client.put_object(Body=report_file.read(), Bucket=s3_bucket, Key=path)
+                # Multipart upload, streaming parts from disk in parallel.
+
+                transfer_config = TransferConfig(multipart_threshold=max(upload_chunk_size(), S3_MINIMUM_PART_SIZE),
+                                                 multipart_chunksize=max(upload_chunk_size(), S3_MINIMUM_PART_SIZE),
+                                                 max_concurrency=upload_concurrency(),
+                                                 use_threads=True)
 
-                    file_sent = True
+                client.upload_file(report_path, s3_bucket, path, Config=transfer_config)
+
+                file_sent = True
         except BaseException:
             traceback.print_exc()
 
@@ -234,3 +401,5 @@ def send_to_destination(destination, report_path, report): # pylint: disable=too
 
     if file_sent is False:
         logger.error('Unable to transmit report to destination "%s".', destination.destination)
+
+    return file_sent
@@ -1,3 +1,696 @@
-# from django.test import TestCase
+# pylint: disable=line-too-long
 
-# Create your tests here.
+from __future__ import unicode_literals
+
+import codecs
+import datetime
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .archive_utils import MASK_USE_DATA_DESCRIPTOR, ReportZipFile
+from .export_cache import fetch_cached_result, prune_result_cache, release_result, result_cache_entry, store_cached_result
+from .models import ReportDestination, ReportJob, ReportJobArchive, ReportTransmission, expired_report_job_ids, partition_data_sources, prune_report_jobs
+from .schedule_utils import next_cron_time
+from .utils import CACHED_IDENTIFIERS, EXPORT_API_HOOKS, EXPORT_API_REGISTRY, EXPORT_API_REGISTRY_LOCK, WRITER_BATCH_ROWS, \
+                   IdentifierCache, UnicodeWriter, fetch_export_identifier, fetch_export_identifiers, reset_export_api_registry
+from .views import simple_data_export_data_sources
+
+def install_export_apis(*export_apis):
+    # Replaces the INSTALLED_APPS scan with the given export APIs, indexed the same way.
+
+    reset_export_api_registry()
+
+    with EXPORT_API_REGISTRY_LOCK:
+        EXPORT_API_REGISTRY['modules'] = list(export_apis)
+        EXPORT_API_REGISTRY['hooks'] = dict((hook_name, [export_api for export_api in export_apis if callable(getattr(export_api, hook_name, None))]) for hook_name in EXPORT_API_HOOKS)
+        EXPORT_API_REGISTRY['data_types'] = []
+        EXPORT_API_REGISTRY['data_type_apis'] = {}
+        EXPORT_API_REGISTRY['arguments'] = {}
+
+class UnseekableStream: # pylint: disable=old-style-class
+    # ZipFile writes data descriptors after each member when it cannot seek back to the header.
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def flush(self):
+        self.stream.flush()
+
+class ReportZipFileTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def assert_copied(self, source, members):
+        output = io.BytesIO()
+
+        with ReportZipFile(output, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_output:
+            zip_output.writestr('before.txt', b'before')
+
+            with zipfile.ZipFile(source, 'r') as source_zip:
+                for source_info in source_zip.infolist():
+                    zip_output.copy_member(source, source_info)
+
+            zip_output.writestr('after.txt', b'after')
+
+        with zipfile.ZipFile(output, 'r') as copied:
+            self.assertIsNone(copied.testzip())
+            self.assertEqual(copied.namelist(), ['before.txt'] + [name for name, _ in members] + ['after.txt'])
+
+            for name, content in members:
+                info = copied.getinfo(name)
+
+                self.assertEqual(copied.read(name), content)
+                self.assertEqual(info.flag_bits & MASK_USE_DATA_DESCRIPTOR, 0)
+
+    def test_copy_member(self):
+        members = [
+            ('deflated.csv', b'a,b\r\n1,2\r\n' * 1000),
+            ('stored.txt', b'stored'),
+        ]
+
+        source = io.BytesIO()
+
+        with zipfile.ZipFile(source, mode='w') as source_zip:
+            source_zip.writestr(members[0][0], members[0][1], compress_type=zipfile.ZIP_DEFLATED)
+            source_zip.writestr(members[1][0], members[1][1], compress_type=zipfile.ZIP_STORED)
+
+        self.assert_copied(source, members)
+
+    @unittest.skipIf(sys.version_info < (3, 6), 'Writing members to unseekable streams requires Python 3.6+.')
+    def test_data_descriptors(self):
+        members = [
+            ('first.csv', b'x,y\r\n' * 2000),
+            ('second.csv', b'z\r\n' * 10),
+        ]
+
+        source = io.BytesIO()
+
+        with zipfile.ZipFile(UnseekableStream(source), mode='w', compression=zipfile.ZIP_DEFLATED) as source_zip:
+            for name, content in members:
+                with source_zip.open(name, 'w') as member:
+                    member.write(content)
+
+        with zipfile.ZipFile(source, 'r') as source_zip:
+            for source_info in source_zip.infolist():
+                self.assertEqual(source_info.flag_bits & MASK_USE_DATA_DESCRIPTOR, MASK_USE_DATA_DESCRIPTOR)
+
+        self.assert_copied(source, members)
+
+    def test_copy_members(self):
+        source_path = os.path.join(self.directory, 'source.zip')
+
+        with zipfile.ZipFile(source_path, mode='w', compression=zipfile.ZIP_DEFLATED) as source_zip:
+            source_zip.writestr('inner.csv', b'inner\r\n' * 100)
+
+        output_path = os.path.join(self.directory, 'output.zip')
+
+        with ReportZipFile(output_path, mode='w') as zip_output:
+            zip_output.copy_members(source_path)
+
+        with zipfile.ZipFile(output_path, 'r') as copied:
+            self.assertIsNone(copied.testzip())
+            self.assertEqual(copied.read('inner.csv'), b'inner\r\n' * 100)
+
+class NextCronTimeTestCase(SimpleTestCase):
+    after = datetime.datetime(2026, 10, 18, 10, 7) # A Sunday.
+
+    def test_strictly_after(self):
+        self.assertEqual(next_cron_time('7 10 * * *', self.after), datetime.datetime(2026, 10, 19, 10, 7))
+        self.assertEqual(next_cron_time('7 10 * * *', self.after.replace(second=30)), datetime.datetime(2026, 10, 19, 10, 7))
+        self.assertEqual(next_cron_time('8 10 * * *', self.after), datetime.datetime(2026, 10, 18, 10, 8))
+
+    def test_steps(self):
+        self.assertEqual(next_cron_time('*/15 * * * *', self.after), datetime.datetime(2026, 10, 18, 10, 15))
+        self.assertEqual(next_cron_time('*/15 * * * *', datetime.datetime(2026, 10, 18, 10, 45)), datetime.datetime(2026, 10, 18, 11, 0))
+        self.assertEqual(next_cron_time('0 */6 * * *', datetime.datetime(2026, 10, 18, 19, 0)), datetime.datetime(2026, 10, 19, 0, 0))
+        self.assertEqual(next_cron_time('10-20/5 * * * *', self.after), datetime.datetime(2026, 10, 18, 10, 10))
+        self.assertEqual(next_cron_time('40/10 * * * *', self.after), datetime.datetime(2026, 10, 18, 10, 40))
+
+    def test_day_fields(self):
+        # Restricting both day of month & day of week matches days that satisfy either.
+
+        self.assertEqual(next_cron_time('0 0 20 * 5', self.after), datetime.datetime(2026, 10, 20, 0, 0))
+        self.assertEqual(next_cron_time('0 0 25 * 5', self.after), datetime.datetime(2026, 10, 23, 0, 0))
+
+        self.assertEqual(next_cron_time('0 0 25 * *', self.after), datetime.datetime(2026, 10, 25, 0, 0))
+        self.assertEqual(next_cron_time('0 0 * * 5', self.after), datetime.datetime(2026, 10, 23, 0, 0))
+        self.assertEqual(next_cron_time('0 0 * 11 5', self.after), datetime.datetime(2026, 11, 6, 0, 0))
+
+    def test_sunday(self):
+        self.assertEqual(next_cron_time('0 9 * * 0', self.after), datetime.datetime(2026, 10, 25, 9, 0))
+        self.assertEqual(next_cron_time('0 9 * * 7', self.after), datetime.datetime(2026, 10, 25, 9, 0))
+        self.assertEqual(next_cron_time('0 11 * * 7', self.after), datetime.datetime(2026, 10, 18, 11, 0))
+
+    def test_leap_day(self):
+        self.assertEqual(next_cron_time('0 12 29 2 *', self.after), datetime.datetime(2028, 2, 29, 12, 0))
+        self.assertEqual(next_cron_time('0 12 29 2 *', datetime.datetime(2028, 2, 29, 12, 0)), datetime.datetime(2032, 2, 29, 12, 0))
+
+    def test_invalid(self):
+        for expression in ('0 25 * * *', '* * * *', '*/0 * * * *', '0 0 31 2 *', '5-1 * * * *', 'x * * * *'):
+            with self.assertRaises(ValueError):
+                next_cron_time(expression, self.after)
+
+class CostEstimator: # pylint: disable=old-style-class, too-few-public-methods
+    __name__ = 'cost_estimator'
+
+    def __init__(self, costs):
+        self.costs = costs
+
+    def estimate_export_cost(self, data_source, data_types, start_time, end_time): # pylint: disable=unused-argument
+        return self.costs.get(data_source, None)
+
+class PartitionDataSourcesTestCase(SimpleTestCase):
+    sources = ['a', 'b', 'c', 'd', 'e', 'f']
+
+    def tearDown(self):
+        reset_export_api_registry()
+
+    def use_estimators(self, *estimators): # pylint: disable=no-self-use
+        install_export_apis(*estimators)
+
+    def partition(self, sources_per_job):
+        return partition_data_sources(self.sources, ['data-type'], None, None, sources_per_job)
+
+    def test_without_estimators(self):
+        self.use_estimators()
+
+        self.assertEqual(self.partition(4), [['a', 'b', 'c', 'd'], ['e', 'f']])
+
+    def test_without_estimates(self):
+        self.use_estimators(CostEstimator({}))
+
+        self.assertEqual(self.partition(4), [['a', 'b', 'c', 'd'], ['e', 'f']])
+
+    def test_single_job(self):
+        self.use_estimators(CostEstimator({'a': 100}))
+
+        self.assertEqual(self.partition(10), [self.sources])
+
+    def test_balances_costs(self):
+        costs = {'a': 10, 'b': 1, 'c': 1, 'd': 1, 'e': 1, 'f': 6}
+
+        self.use_estimators(CostEstimator(costs))
+
+        partitions = self.partition(3)
+
+        # Fixed chunks would cost 12 & 8.
+
+        self.assertEqual(partitions, [['a'], ['b', 'c', 'd', 'e', 'f']])
+        self.assertEqual([sum(costs[source] for source in partition) for partition in partitions], [10, 10])
+
+    def test_sums_estimators(self):
+        self.use_estimators(CostEstimator({'a': 6, 'f': 6}), CostEstimator({'a': 4, 'b': 1, 'c': 1, 'd': 1, 'e': 1}))
+
+        self.assertEqual(self.partition(3), [['a'], ['b', 'c', 'd', 'e', 'f']])
+
+    def test_missing_estimates(self):
+        # Sources without estimates count as the mean of the known costs.
+
+        self.use_estimators(CostEstimator({'a': 4, 'c': 4, 'e': 4}))
+
+        partitions = self.partition(2)
+
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual(sorted(source for partition in partitions for source in partition), self.sources)
+        self.assertEqual([len(partition) for partition in partitions], [2, 2, 2])
+
+class UnicodeWriterTestCase(SimpleTestCase):
+    def test_bom_once(self):
+        stream = io.BytesIO()
+
+        writer = UnicodeWriter(stream)
+        writer.writerow(['name', 'value'])
+        writer.writerows([['caf\xe9', index] for index in range(WRITER_BATCH_ROWS + 10)])
+
+        content = stream.getvalue()
+
+        self.assertTrue(content.startswith(codecs.BOM_UTF8))
+        self.assertEqual(content.count(codecs.BOM_UTF8), 1)
+
+        lines = content.decode('utf-8-sig').splitlines()
+
+        self.assertEqual(len(lines), WRITER_BATCH_ROWS + 11)
+        self.assertEqual(lines[0], 'name,value')
+        self.assertEqual(lines[1], 'caf\xe9,0')
+        self.assertEqual(lines[-1], 'caf\xe9,%s' % (WRITER_BATCH_ROWS + 9))
+
+    def test_append(self):
+        stream = io.BytesIO()
+
+        UnicodeWriter(stream).writerow(['first'])
+        UnicodeWriter(stream).writerow(['second'])
+
+        self.assertEqual(stream.getvalue(), codecs.BOM_UTF8 + b'first\r\nsecond\r\n')
+
+    def test_without_bom(self):
+        stream = io.BytesIO()
+
+        UnicodeWriter(stream, encoding='utf-8').writerows([['caf\xe9']])
+
+        self.assertEqual(stream.getvalue(), b'caf\xc3\xa9\r\n')
+
+class PrefixObfuscator: # pylint: disable=old-style-class, too-few-public-methods
+    __name__ = 'prefix_obfuscator'
+
+    def __init__(self):
+        self.obfuscated = []
+
+    def obfuscate_identifier(self, identifier):
+        self.obfuscated.append(identifier)
+
+        return 'obfuscated-%s' % identifier
+
+SHARED_IDENTIFIER_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'identifiers': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'simple_data_export_test_identifiers',
+    },
+}
+
+class IdentifierCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.obfuscator = PrefixObfuscator()
+
+        install_export_apis(self.obfuscator)
+
+        CACHED_IDENTIFIERS.clear()
+
+    def tearDown(self):
+        CACHED_IDENTIFIERS.clear()
+
+        reset_export_api_registry()
+
+    @override_settings(SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE_SIZE=2)
+    def test_evicts_least_recently_used(self):
+        cache = IdentifierCache()
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(cache.get('a'), 1) # "b" is now least recently used.
+
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+        cache.set('a', 4) # Updating also counts as a use.
+        cache.set('d', 5)
+
+        self.assertEqual(cache.get_many(['a', 'c', 'd']), {'a': 4, 'd': 5})
+
+    def test_counters(self):
+        cache = IdentifierCache()
+
+        cache.set_many({'a': 1, 'b': 2})
+
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(cache.get('c', 'missing'), 'missing')
+
+        stats = cache.stats()
+
+        self.assertEqual((stats['hits'], stats['shared_hits'], stats['misses'], stats['size']), (2, 0, 2, 2))
+
+        cache.clear()
+
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    @override_settings(CACHES=SHARED_IDENTIFIER_CACHES, SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE='identifiers')
+    def test_shared_counters(self):
+        first = IdentifierCache()
+        first.set('a', 1)
+
+        second = IdentifierCache() # Another process.
+
+        self.assertEqual(second.get_many(['a', 'b']), {'a': 1})
+        self.assertEqual(second.get('a'), 1)
+
+        stats = second.stats()
+
+        self.assertEqual((stats['hits'], stats['shared_hits'], stats['misses']), (1, 1, 1))
+
+    def test_fetch_export_identifiers(self):
+        identifiers = fetch_export_identifiers(['b', ('a', 'Source A', 'Category'), 'b', 'c', 'a'])
+
+        self.assertEqual(identifiers, ['obfuscated-b', 'obfuscated-a', 'obfuscated-b', 'obfuscated-c', 'obfuscated-a'])
+        self.assertEqual(self.obfuscator.obfuscated, ['b', 'a', 'c'])
+
+        self.assertEqual(fetch_export_identifier('c'), 'obfuscated-c')
+        self.assertEqual(fetch_export_identifiers(['d', 'a', 'd']), ['obfuscated-d', 'obfuscated-a', 'obfuscated-d'])
+        self.assertEqual(self.obfuscator.obfuscated, ['b', 'a', 'c', 'd'])
+
+class DataSourceCatalog: # pylint: disable=old-style-class, too-few-public-methods
+    __name__ = 'data_source_catalog'
+
+    def export_data_sources(self): # pylint: disable=no-self-use
+        sources = [('source-%03d' % index, 'Source %03d' % index, 'Participants') for index in range(250)]
+
+        sources.append(('cafe', 'Caf\xe9 \u2603', 'Locations'))
+
+        return sources
+
+class DataSourcesViewTestCase(SimpleTestCase):
+    def setUp(self):
+        install_export_apis(DataSourceCatalog())
+
+        self.user = get_user_model()(username='staff', is_staff=True, is_active=True)
+
+    def tearDown(self):
+        reset_export_api_registry()
+
+    def fetch(self, **parameters):
+        parameters['refresh'] = '1'
+
+        request = RequestFactory().get('/', parameters)
+        request.user = self.user
+
+        return json.loads(simple_data_export_data_sources(request).content.decode('utf-8'))
+
+    def test_pages(self):
+        response = self.fetch(page_size=100)
+
+        self.assertEqual((response['count'], response['page'], response['pages']), (251, 1, 3))
+        self.assertEqual(response['sources'][0], {'identifier': 'cafe', 'name': 'Caf\xe9 \u2603', 'category': 'Locations'})
+
+        response = self.fetch(page_size=100, page=3)
+
+        self.assertEqual(response['page'], 3)
+        self.assertEqual(len(response['sources']), 51)
+
+        self.assertEqual(self.fetch(page_size=100, page=9)['page'], 3)
+        self.assertEqual(self.fetch(page_size=100, page='last')['page'], 1)
+
+    def test_query(self):
+        response = self.fetch(q='CAF\xc9')
+
+        self.assertEqual(response['count'], 1)
+        self.assertEqual(response['sources'][0]['identifier'], 'cafe')
+
+        response = self.fetch(q='\u2603')
+
+        self.assertEqual(response['count'], 1)
+
+        response = self.fetch(q='unknown')
+
+        self.assertEqual((response['count'], response['page'], response['sources']), (0, 1, []))
+
+class ResultCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, 'cache')
+
+        self.settings = override_settings(SIMPLE_DATA_EXPORT_RESULT_CACHE_DIR=self.cache_directory, SIMPLE_DATA_EXPORT_RESULT_CACHE_MAX_BYTES=0)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def export(self, content=b'a,b\r\n1,2\r\n'):
+        file_path = os.path.join(tempfile.mkdtemp(dir=self.directory), 'export.csv')
+
+        with io.open(file_path, 'wb') as export_file:
+            export_file.write(content)
+
+        return file_path
+
+    def age(self, key, seconds=20 * 60):
+        entry = result_cache_entry(key)
+
+        stale = time.time() - seconds
+
+        os.utime(entry, (stale, stale))
+
+    def test_store_keeps_output(self):
+        file_path = self.export()
+
+        self.assertTrue(store_cached_result('ab' * 32, file_path))
+        self.assertFalse(store_cached_result('ab' * 32, self.export())) # Already stored.
+
+        self.age('ab' * 32)
+
+        self.assertEqual(prune_result_cache(), 1)
+
+        with io.open(file_path, 'rb') as export_file:
+            self.assertEqual(export_file.read(), b'a,b\r\n1,2\r\n')
+
+        self.assertIsNone(fetch_cached_result('ab' * 32))
+
+    def test_fetch_survives_eviction(self):
+        store_cached_result('cd' * 32, self.export(b'cached'))
+
+        cached_path = fetch_cached_result('cd' * 32)
+
+        self.assertEqual(os.path.basename(cached_path), 'export.csv')
+
+        self.age('cd' * 32)
+
+        self.assertEqual(prune_result_cache(), 1)
+        self.assertFalse(os.path.exists(result_cache_entry('cd' * 32)))
+
+        with io.open(cached_path, 'rb') as cached_file:
+            self.assertEqual(cached_file.read(), b'cached')
+
+        os.remove(cached_path)
+        release_result(cached_path)
+
+        self.assertFalse(os.path.exists(os.path.dirname(cached_path)))
+
+    def test_recent_entries_kept(self):
+        store_cached_result('ef' * 32, self.export())
+
+        self.assertEqual(prune_result_cache(), 0)
+
+        cached_path = fetch_cached_result('ef' * 32)
+
+        self.assertIsNotNone(cached_path)
+
+        release_result(cached_path)
+
+class ReportJobClaimTestCase(TestCase):
+    def setUp(self):
+        self.requester = get_user_model().objects.create(username='claimant')
+
+    def request_job(self, minutes_ago=0):
+        return ReportJob.objects.create(requester=self.requester, requested=(timezone.now() - datetime.timedelta(minutes=minutes_ago)))
+
+    def expire_lease(self, job):
+        ReportJob.objects.filter(pk=job.pk).update(lease_expires=(timezone.now() - datetime.timedelta(seconds=1)))
+
+    def test_claims_oldest_pending_job(self):
+        self.request_job()
+        oldest = self.request_job(minutes_ago=5)
+
+        job = ReportJob.objects.claim_job()
+
+        self.assertEqual(job.pk, oldest.pk)
+        self.assertEqual(job.claim_count, 1)
+        self.assertIsNotNone(job.claim_token)
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).claim_token, job.claim_token)
+
+        self.assertNotEqual(ReportJob.objects.claim_job().pk, oldest.pk)
+        self.assertIsNone(ReportJob.objects.claim_job())
+
+    def test_expired_lease_reclaimed(self):
+        self.request_job()
+
+        lost = ReportJob.objects.claim_job()
+
+        self.expire_lease(lost)
+
+        job = ReportJob.objects.claim_job()
+
+        self.assertEqual(job.pk, lost.pk)
+        self.assertEqual(job.claim_count, 2)
+        self.assertNotEqual(job.claim_token, lost.claim_token)
+
+        self.assertFalse(lost.renew_lease())
+        self.assertTrue(job.renew_lease())
+
+    def test_renew_lease(self):
+        self.request_job()
+
+        job = ReportJob.objects.claim_job()
+
+        self.expire_lease(job)
+
+        self.assertTrue(job.renew_lease())
+        self.assertGreater(ReportJob.objects.get(pk=job.pk).lease_expires, timezone.now())
+        self.assertIsNone(ReportJob.objects.claim_job())
+
+    def test_complete_requires_claim(self):
+        self.request_job()
+
+        lost = ReportJob.objects.claim_job()
+
+        self.expire_lease(lost)
+
+        job = ReportJob.objects.claim_job()
+
+        lost.report.name = 'lost.zip'
+        job.report.name = 'kept.zip'
+        job.report_size = 1024
+
+        self.assertFalse(lost.complete())
+        self.assertTrue(job.complete())
+        self.assertFalse(job.complete())
+
+        completed = ReportJob.objects.get(pk=job.pk)
+
+        self.assertEqual(completed.report.name, 'kept.zip')
+        self.assertEqual(completed.report_size, 1024)
+        self.assertIsNotNone(completed.completed)
+
+    @override_settings(SIMPLE_DATA_EXPORT_REPORT_JOB_MAX_CLAIMS=2)
+    def test_fail_exhausted_jobs(self):
+        self.request_job()
+
+        self.expire_lease(ReportJob.objects.claim_job())
+
+        self.assertEqual(ReportJob.objects.fail_exhausted_jobs(), [])
+
+        job = ReportJob.objects.claim_job()
+
+        self.assertEqual(ReportJob.objects.fail_exhausted_jobs(), [])
+
+        self.expire_lease(job)
+
+        failed = ReportJob.objects.fail_exhausted_jobs()
+
+        self.assertEqual([failed_job.pk for failed_job in failed], [job.pk])
+        self.assertIsNotNone(ReportJob.objects.get(pk=job.pk).failed)
+
+        self.assertEqual(ReportJob.objects.fail_exhausted_jobs(), [])
+        self.assertIsNone(ReportJob.objects.claim_job())
+        self.assertFalse(job.complete())
+
+class ReportRetentionTestCase(TestCase):
+    def setUp(self):
+        self.requester = get_user_model().objects.create(username='retained')
+
+    def finished_job(self, days_ago, failed=False):
+        finished = timezone.now() - datetime.timedelta(days=days_ago)
+
+        job = ReportJob(requester=self.requester, requested=finished, started=finished)
+
+        if failed:
+            job.failed = finished
+        else:
+            job.completed = finished
+            job.report_size = 0
+
+        job.save()
+
+        return job
+
+    @override_settings(SIMPLE_DATA_EXPORT_RETENTION_DAYS=30)
+    def test_failed_aged_by_failure(self):
+        expired_failure = self.finished_job(45, failed=True)
+        self.finished_job(5, failed=True)
+        expired_report = self.finished_job(45)
+        self.finished_job(5)
+
+        ReportJob.objects.create(requester=self.requester, requested=(timezone.now() - datetime.timedelta(days=60)))
+
+        self.assertEqual(expired_report_job_ids(), sorted([expired_failure.pk, expired_report.pk]))
+
+    @override_settings(SIMPLE_DATA_EXPORT_RETENTION_MAX_REPORTS=1)
+    def test_failed_counted_apart(self):
+        expired_failure = self.finished_job(3, failed=True)
+        self.finished_job(2, failed=True)
+        expired_report = self.finished_job(4)
+        self.finished_job(1)
+
+        self.assertEqual(expired_report_job_ids(), sorted([expired_failure.pk, expired_report.pk]))
+
+    @override_settings(SIMPLE_DATA_EXPORT_RETENTION_DAYS=30)
+    def test_failed_jobs_archived(self):
+        failed = self.finished_job(45, failed=True)
+
+        self.assertEqual(prune_report_jobs(archive=True), 1)
+        self.assertFalse(ReportJob.objects.filter(pk=failed.pk).exists())
+
+        archive = ReportJobArchive.objects.get(job_id=failed.pk)
+
+        self.assertEqual(archive.failed, failed.failed)
+        self.assertIsNone(archive.completed)
+
+class ReportTransmissionTestCase(TestCase):
+    def setUp(self):
+        requester = get_user_model().objects.create(username='recipient')
+
+        self.job = ReportJob.objects.create(requester=requester, requested=timezone.now(), completed=timezone.now())
+
+        ReportDestination.objects.create(user=requester, destination='nowhere') # pylint: disable=no-member
+
+        ReportTransmission.objects.enqueue(self.job)
+
+    def lapse_lease(self):
+        ReportTransmission.objects.filter(job=self.job).update(next_attempt=(timezone.now() - datetime.timedelta(seconds=1)))
+
+    def test_unhandled_destination(self):
+        transmission = ReportTransmission.objects.claim_transmission(60)
+
+        self.assertTrue(transmission.record_outcome(None))
+
+        transmission = ReportTransmission.objects.get(pk=transmission.pk)
+
+        self.assertIsNone(transmission.transmitted)
+        self.assertIn('nowhere', transmission.last_error)
+        self.assertGreater(transmission.next_attempt, timezone.now())
+
+    def test_lost_claim_outcome_ignored(self):
+        lost = ReportTransmission.objects.claim_transmission(60)
+
+        self.lapse_lease()
+
+        transmission = ReportTransmission.objects.claim_transmission(60)
+
+        self.assertEqual(transmission.attempts, 2)
+
+        self.assertTrue(transmission.record_failure('Transmission timed out.'))
+        self.assertFalse(lost.record_success())
+
+        transmission = ReportTransmission.objects.get(pk=transmission.pk)
+
+        self.assertIsNone(transmission.transmitted)
+        self.assertEqual(transmission.last_error, 'Transmission timed out.')
+
+    @override_settings(SIMPLE_DATA_EXPORT_TRANSMISSION_MAX_ATTEMPTS=1)
+    def test_exhausted_attempts_fail(self):
+        transmission = ReportTransmission.objects.claim_transmission(60)
+
+        self.assertTrue(transmission.record_outcome(False))
+        self.assertFalse(transmission.record_success())
+
+        transmission = ReportTransmission.objects.get(pk=transmission.pk)
+
+        self.assertIsNotNone(transmission.failed)
+        self.assertIsNone(transmission.transmitted)
+        self.assertIsNone(ReportTransmission.objects.claim_transmission(60))
@@ -7,9 +7,10 @@ if sys.version_info[0] > 2:
 else:
     from django.conf.urls import url
 
-from .views import simple_data_export_download_report, simple_data_export_form
+from .views import simple_data_export_download_report, simple_data_export_form, simple_data_export_data_sources
 
 urlpatterns = [
     url(r'^report/(?P<report_id>\d+)/download$', simple_data_export_download_report, name='simple_data_export_download_report'),
+    url(r'^data-sources.json$', simple_data_export_data_sources, name='simple_data_export_data_sources'),
     url(r'^$', simple_data_export_form, name='simple_data_export_form'),
 ]
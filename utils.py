@@ -1,43 +1,626 @@
+# pylint: disable=line-too-long
+
+import codecs
+import collections
+import csv
+import hashlib
 import importlib
+import inspect
+import io
+import itertools
+import sys
+import threading
 
 import unicodecsv
 
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None # Columnar export formats unavailable.
+
 from django.conf import settings
+from django.core.cache import cache, caches
 
-CACHED_IDENTIFIERS = {}
+WRITER_BATCH_ROWS = 1000
 
-def fetch_export_identifier(original_identifier):
-    if isinstance(original_identifier, (tuple, list)):
-        original_identifier = original_identifier[0]
+EXPORT_API_HOOKS = (
+    'export_data_sources',
+    'export_data_types',
+    'compile_data_export',
+    'estimate_export_cost',
+    'export_cache_version',
+    'obfuscate_identifier',
+    'obfuscate_identifiers',
+    'send_to_destination',
+)
+
+EXPORT_API_REGISTRY = {}
+EXPORT_API_REGISTRY_LOCK = threading.RLock()
+
+def export_api_registry():
+    # Scans INSTALLED_APPS for simple_data_export_api modules once per process and indexes them by hook and data type.
+
+    with EXPORT_API_REGISTRY_LOCK:
+        if not EXPORT_API_REGISTRY:
+            modules = []
+
+            for app in settings.INSTALLED_APPS:
+                try:
+                    modules.append(importlib.import_module(app + '.simple_data_export_api'))
+                except ImportError:
+                    pass
+
+            hooks = {}
+
+            for hook_name in EXPORT_API_HOOKS:
+                hooks[hook_name] = [export_api for export_api in modules if callable(getattr(export_api, hook_name, None))]
+
+            data_types = []
+            data_type_apis = {}
+
+            for export_api in hooks['export_data_types']:
+                for data_type in export_api.export_data_types():
+                    if (data_type in data_types) is False:
+                        data_types.append(data_type)
+
+                    data_type_apis.setdefault(data_type[0], [])
+
+                    if (export_api in data_type_apis[data_type[0]]) is False and export_api in hooks['compile_data_export']:
+                        data_type_apis[data_type[0]].append(export_api)
+
+            EXPORT_API_REGISTRY['modules'] = modules
+            EXPORT_API_REGISTRY['hooks'] = hooks
+            EXPORT_API_REGISTRY['data_types'] = data_types
+            EXPORT_API_REGISTRY['data_type_apis'] = data_type_apis
+            EXPORT_API_REGISTRY['arguments'] = {}
+
+        return EXPORT_API_REGISTRY
+
+def reset_export_api_registry():
+    with EXPORT_API_REGISTRY_LOCK:
+        EXPORT_API_REGISTRY.clear()
+
+def fetch_export_apis(hook_name):
+    return export_api_registry()['hooks'].get(hook_name, [])
+
+def fetch_export_data_types():
+    return export_api_registry()['data_types']
+
+def export_api_accepts(export_api, hook_name, argument):
+    # Lets newer keyword arguments reach hooks that declare them (or **kwargs) without breaking older exporters.
+
+    registry = export_api_registry()
+
+    key = (export_api.__name__, hook_name)
+
+    with EXPORT_API_REGISTRY_LOCK:
+        if (key in registry['arguments']) is False:
+            hook = getattr(export_api, hook_name)
+
+            if hasattr(inspect, 'signature'):
+                parameters = inspect.signature(hook).parameters.values()
+
+                if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters):
+                    registry['arguments'][key] = None
+                else:
+                    registry['arguments'][key] = frozenset(parameter.name for parameter in parameters)
+            else: # Python 2
+                argspec = inspect.getargspec(hook) # pylint: disable=no-member,deprecated-method
+
+                if argspec.keywords is not None:
+                    registry['arguments'][key] = None
+                else:
+                    registry['arguments'][key] = frozenset(argspec.args)
+
+        arguments = registry['arguments'][key]
 
-    if original_identifier in CACHED_IDENTIFIERS:
-        return CACHED_IDENTIFIERS[original_identifier]
+    return arguments is None or argument in arguments
+
+DATA_SOURCE_CATALOG_CACHE_KEY = 'simple_data_export_data_source_catalog'
+
+def fetch_data_source_catalog(refresh=False):
+    # Sorted (identifier, name, category) tuples from every export_data_sources hook, cached in the Django cache.
+
+    catalog = None
+
+    if refresh is False:
+        catalog = cache.get(DATA_SOURCE_CATALOG_CACHE_KEY)
+
+    if catalog is None:
+        catalog = []
+
+        for export_api in fetch_export_apis('export_data_sources'):
+            for data_source in export_api.export_data_sources():
+                if isinstance(data_source, str):
+                    data_source = (data_source, data_source, 'Uncategorized Data Source')
+
+                data_source = tuple(data_source)
+
+                if (data_source in catalog) is False:
+                    catalog.append(data_source)
+
+        catalog.sort(key=lambda source: '%s--%s' % (source[2], source[1]))
+
+        timeout = 5 * 60
 
-    for app in settings.INSTALLED_APPS:
         try:
-            export_api = importlib.import_module(app + '.simple_data_export_api')
+            timeout = settings.SIMPLE_DATA_EXPORT_DATA_SOURCE_CACHE_TIMEOUT
+        except AttributeError:
+            pass
+
+        cache.set(DATA_SOURCE_CATALOG_CACHE_KEY, catalog, timeout)
 
-            new_identifier = export_api.obfuscate_identifier(original_identifier)
+    return catalog
 
-            if new_identifier is not None:
-                CACHED_IDENTIFIERS[original_identifier] = new_identifier
+def invalidate_data_source_catalog():
+    cache.delete(DATA_SOURCE_CATALOG_CACHE_KEY)
 
-                return new_identifier
-        except ImportError:
+def fetch_data_type_export_apis(data_type):
+    # Apps declaring the data type come first. Other exporters follow, as some compile types they do not declare.
+
+    registry = export_api_registry()
+
+    export_apis = list(registry['data_type_apis'].get(data_type, []))
+
+    for export_api in registry['hooks']['compile_data_export']:
+        if (export_api in export_apis) is False:
+            export_apis.append(export_api)
+
+    return export_apis
+
+class IdentifierCache:
+    # Bounded LRU cache of obfuscated identifiers. When SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE names a
+    # Django cache alias, entries are also shared through that cache with other processes.
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def max_size(self): # pylint: disable=no-self-use
+        try:
+            return settings.SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE_SIZE
+        except AttributeError:
             pass
+
+        return 100000
+
+    def shared_cache(self): # pylint: disable=no-self-use
+        try:
+            return caches[settings.SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE]
         except AttributeError:
             pass
 
-    CACHED_IDENTIFIERS[original_identifier] = original_identifier
+        return None
+
+    def shared_key(self, identifier): # pylint: disable=no-self-use
+        identifier = '%s:%s' % (type(identifier).__name__, identifier)
+
+        return 'simple_data_export_identifier_' + hashlib.sha256(identifier.encode('utf-8')).hexdigest()
+
+    def get_many(self, identifiers):
+        found = {}
+        missing = []
+
+        with self.lock:
+            for identifier in identifiers:
+                if identifier in self.entries:
+                    value = self.entries.pop(identifier) # Re-inserted as most recently used.
+                    self.entries[identifier] = value
+
+                    found[identifier] = value
+                else:
+                    missing.append(identifier)
+
+            self.hits += len(found)
+
+        shared = {}
+
+        shared_cache = self.shared_cache()
+
+        if missing and shared_cache is not None:
+            keys = dict((self.shared_key(identifier), identifier) for identifier in missing)
+
+            for key, value in shared_cache.get_many(list(keys.keys())).items():
+                shared[keys[key]] = value
+
+            self.set_many(shared, share=False)
+
+            found.update(shared)
+
+        with self.lock:
+            self.shared_hits += len(shared)
+            self.misses += len(missing) - len(shared)
+
+        return found
+
+    def get(self, identifier, default=None):
+        return self.get_many([identifier]).get(identifier, default)
+
+    def set_many(self, identifiers, share=True):
+        max_size = self.max_size()
+
+        with self.lock:
+            for identifier, value in identifiers.items():
+                self.entries.pop(identifier, None) # Re-inserted as most recently used.
+                self.entries[identifier] = value
+
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+        shared_cache = self.shared_cache()
+
+        if share and identifiers and shared_cache is not None:
+            timeout = 7 * 24 * 60 * 60
+
+            try:
+                timeout = settings.SIMPLE_DATA_EXPORT_IDENTIFIER_CACHE_TIMEOUT
+            except AttributeError:
+                pass
+
+            shared_cache.set_many(dict((self.shared_key(identifier), value) for identifier, value in identifiers.items()), timeout)
+
+    def set(self, identifier, value):
+        self.set_many({identifier: value})
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size(),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+            }
+
+    def __contains__(self, identifier):
+        with self.lock:
+            return identifier in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+CACHED_IDENTIFIERS = IdentifierCache()
+
+def obfuscate_identifiers(original_identifiers):
+    # Uncached obfuscation. Apps are consulted in INSTALLED_APPS order, using the batch obfuscate_identifiers
+    # hook where implemented (returning None for identifiers it leaves to others) and obfuscate_identifier otherwise.
+
+    registry = export_api_registry()
+
+    new_identifiers = {}
+
+    pending = list(original_identifiers)
+
+    for export_api in registry['modules']:
+        if not pending:
+            break
+
+        if export_api in registry['hooks']['obfuscate_identifiers']:
+            for original_identifier, new_identifier in zip(pending, export_api.obfuscate_identifiers(pending)):
+                if new_identifier is not None:
+                    new_identifiers[original_identifier] = new_identifier
+        elif export_api in registry['hooks']['obfuscate_identifier']:
+            for original_identifier in pending:
+                new_identifier = export_api.obfuscate_identifier(original_identifier)
+
+                if new_identifier is not None:
+                    new_identifiers[original_identifier] = new_identifier
+
+        pending = [identifier for identifier in pending if (identifier in new_identifiers) is False]
+
+    for original_identifier in pending:
+        new_identifiers[original_identifier] = original_identifier
+
+    return new_identifiers
+
+def obfuscate_identifier_columns(rows, columns):
+    # Replaces the given column indices of each row (lists or dicts) with export identifiers, in one batch.
+
+    rows = list(rows)
+
+    identifiers = fetch_export_identifiers([row[column] for row in rows for column in columns])
+
+    index = 0
+
+    for row in rows:
+        for column in columns:
+            row[column] = identifiers[index]
+
+            index += 1
+
+    return rows
+
+def fetch_export_identifier(original_identifier):
+    return fetch_export_identifiers([original_identifier])[0]
+
+def fetch_export_identifiers(original_identifiers):
+    # Batch form of fetch_export_identifier: returns obfuscated identifiers in the order given.
 
-    return original_identifier
+    original_identifiers = [(identifier[0] if isinstance(identifier, (tuple, list)) else identifier) for identifier in original_identifiers]
+
+    unique_identifiers = list(collections.OrderedDict.fromkeys(original_identifiers))
+
+    obfuscated = CACHED_IDENTIFIERS.get_many(unique_identifiers)
+
+    new_identifiers = obfuscate_identifiers([identifier for identifier in unique_identifiers if (identifier in obfuscated) is False])
+
+    if new_identifiers:
+        CACHED_IDENTIFIERS.set_many(new_identifiers)
+
+        obfuscated.update(new_identifiers)
+
+    return [obfuscated[identifier] for identifier in original_identifiers]
 
 class UnicodeWriter: # pylint: disable=old-style-class
-    def __init__(self, file_stream, dialect=unicodecsv.excel, encoding='utf-8-sig', **kwds):
-        self.writer = unicodecsv.writer(file_stream, dialect=dialect, encoding=encoding, **kwds)
+    # On Python 3, rows are formatted by the standard library csv module and encoded incrementally, so
+    # encodings with a BOM (utf-8-sig) emit it once per stream instead of once per row. On Python 2, the
+    # BOM is written up front & unicodecsv encodes cells as plain UTF-8.
+
+    def __init__(self, file_stream, dialect=csv.excel, encoding='utf-8-sig', errors='strict', **kwds):
+        self.file_stream = file_stream
+        self.pending = None
+
+        appending = False
+
+        try:
+            appending = file_stream.tell() > 0 # Appending to existing content - skip the BOM.
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+
+        if sys.version_info[0] < 3:
+            self.encoder = None
+
+            # unicodecsv encodes each cell separately, so write the BOM once here & encode cells without it.
+
+            if codecs.lookup(encoding).name == 'utf-8-sig':
+                encoding = 'utf-8'
+
+                if appending is False:
+                    file_stream.write(codecs.BOM_UTF8)
+
+            self.writer = unicodecsv.writer(file_stream, dialect=dialect, encoding=encoding, errors=errors, **kwds)
+        else:
+            self.encoder = codecs.getincrementalencoder(encoding)(errors)
+            self.writer = csv.writer(self, dialect=dialect, **kwds)
+
+            if appending:
+                self.encoder.setstate(0)
+
+    @property
+    def dialect(self):
+        return self.writer.dialect
+
+    def write(self, line):
+        # Called by csv.writer with each formatted row.
+
+        if self.pending is None:
+            self.file_stream.write(self.encoder.encode(line))
+        else:
+            self.pending.append(line)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        if self.encoder is None:
+            self.writer.writerows(rows)
+
+            return
+
+        rows = iter(rows)
+
+        try:
+            while True:
+                batch = list(itertools.islice(rows, WRITER_BATCH_ROWS))
+
+                if not batch:
+                    break
+
+                self.pending = []
+
+                self.writer.writerows(batch)
+
+                self.file_stream.write(self.encoder.encode(''.join(self.pending)))
+        finally:
+            self.pending = None
+
+class ExportWriter: # pylint: disable=old-style-class
+    # Writes rows of a data type export to a file at path. Subclasses implement a file format - exporters that
+    # accept a "writer" argument in compile_data_export receive the subclass selected for the report.
+
+    export_format = None
+    extension = None
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = list(columns) if columns is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def writerow(self, row):
+        self.writerows([row])
+
+    def writerows(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+class CSVExportWriter(ExportWriter):
+    export_format = 'csv'
+    extension = 'csv'
+
+    def __init__(self, path, columns=None, **kwds):
+        ExportWriter.__init__(self, path, columns)
+
+        self.file_stream = io.open(path, 'wb') # pylint: disable=consider-using-with
+        self.writer = UnicodeWriter(self.file_stream, **kwds)
+
+        if self.columns is not None:
+            self.writer.writerow(self.columns)
 
     def writerow(self, row):
         self.writer.writerow(row)
 
     def writerows(self, rows):
         self.writer.writerows(rows)
+
+    def close(self):
+        self.file_stream.close()
+
+class ColumnarExportWriter(ExportWriter):
+    # Buffers rows into record batches. Column types are inferred from the first batch unless a pyarrow
+    # schema is provided - columns that are empty or mix value types in the first batch are written as
+    # strings. Later values that do not convert losslessly to a column's type raise ValueError.
+
+    def __init__(self, path, columns=None, schema=None):
+        if pyarrow is None:
+            raise ValueError('The "%s" export format requires the pyarrow package.' % self.export_format)
+
+        if schema is not None:
+            columns = schema.names
+
+        if columns is None:
+            raise ValueError('The "%s" export format requires column names.' % self.export_format)
+
+        ExportWriter.__init__(self, path, columns)
+
+        self.schema = schema
+        self.pending = []
+        self.writer = None
+
+    def open_writer(self):
+        raise NotImplementedError
+
+    def infer_schema(self, columns):
+        fields = []
+
+        for name, values in zip(self.columns, columns):
+            try:
+                data_type = pyarrow.array(values).type # Integers mixed with floats widen to doubles.
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                data_type = pyarrow.string()
+
+            if pyarrow.types.is_null(data_type):
+                data_type = pyarrow.string()
+
+            fields.append(pyarrow.field(name, data_type))
+
+        return pyarrow.schema(fields)
+
+    def column_array(self, values, field):
+        # Values are converted with a safe cast, so 1.5 is never truncated into an integer column.
+
+        try:
+            return pyarrow.array(values).cast(field.type)
+        except pyarrow.ArrowException:
+            pass
+
+        if pyarrow.types.is_string(field.type):
+            return pyarrow.array([(None if value is None else str(value)) for value in values], type=field.type)
+
+        raise ValueError('Values in the "%s" column do not fit its %s type. Provide a schema to the %s export writer.' % (field.name, field.type, self.export_format))
+
+    def flush_rows(self):
+        if not self.pending:
+            return
+
+        columns = list(zip(*self.pending))
+
+        self.pending = []
+
+        if self.schema is None:
+            self.schema = self.infer_schema(columns)
+
+        arrays = [self.column_array(values, field) for values, field in zip(columns, self.schema)]
+
+        if self.writer is None:
+            self.writer = self.open_writer()
+
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def writerows(self, rows):
+        for row in rows:
+            self.pending.append(row)
+
+            if len(self.pending) >= WRITER_BATCH_ROWS:
+                self.flush_rows()
+
+    def close(self):
+        self.flush_rows()
+
+        if self.writer is None: # No rows - write an empty file with the expected columns.
+            if self.schema is None:
+                self.schema = pyarrow.schema([(column, pyarrow.string()) for column in self.columns])
+
+            self.writer = self.open_writer()
+
+        self.writer.close()
+
+class ParquetExportWriter(ColumnarExportWriter):
+    export_format = 'parquet'
+    extension = 'parquet'
+
+    def open_writer(self):
+        compression = 'snappy'
+
+        try:
+            compression = settings.SIMPLE_DATA_EXPORT_PARQUET_COMPRESSION
+        except AttributeError:
+            pass
+
+        return pyarrow.parquet.ParquetWriter(self.path, self.schema, compression=compression)
+
+class ArrowExportWriter(ColumnarExportWriter):
+    export_format = 'arrow'
+    extension = 'arrow'
+
+    def open_writer(self):
+        return pyarrow.ipc.new_file(self.path, self.schema)
+
+EXPORT_WRITERS = {
+    'csv': CSVExportWriter,
+    'parquet': ParquetExportWriter,
+    'arrow': ArrowExportWriter,
+}
+
+def fetch_export_writer(custom_parameters=None):
+    export_format = None
+
+    if custom_parameters is not None:
+        export_format = custom_parameters.get('export_format', None)
+
+    if export_format is None:
+        export_format = 'csv'
+
+        try:
+            export_format = settings.SIMPLE_DATA_EXPORT_FORMAT
+        except AttributeError:
+            pass
+
+    if (export_format in EXPORT_WRITERS) is False:
+        raise ValueError('Unknown export format "%s". Use one of: %s.' % (export_format, ', '.join(sorted(EXPORT_WRITERS.keys()))))
+
+    if EXPORT_WRITERS[export_format] is not CSVExportWriter and pyarrow is None:
+        raise ValueError('The "%s" export format requires the pyarrow package.' % export_format)
+
+    return EXPORT_WRITERS[export_format]
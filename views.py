@@ -1,16 +1,17 @@
 # pylint: disable=line-too-long, invalid-name
 
-import importlib
 import io
 import os
 
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import FileResponse
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import FileResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils.encoding import smart_str
 
 from .models import ReportJob
+from .utils import fetch_data_source_catalog, fetch_export_data_types, invalidate_data_source_catalog
 
 @staff_member_required
 def simple_data_export_download_report(request, report_id): # pylint: disable=unused-argument
@@ -27,67 +28,70 @@ def simple_data_export_download_report(request, report_id): # pylint: disable=un
 
     return response
 
-@staff_member_required
-def simple_data_export_form(request): # pylint: disable=too-many-branches
-    context = {}
-
-    new_sources = []
-
-    for app in settings.INSTALLED_APPS:
-        try:
-            export_api = importlib.import_module(app + '.simple_data_export_api')
-
-            data_sources = export_api.export_data_sources()
+def filter_data_sources(data_sources, query):
+    query = query.strip().lower()
 
-            for data_source in data_sources:
-                if isinstance(data_source, str):
-                    data_source = (data_source, data_source, 'Uncategorized Data Source')
+    if query == '':
+        return data_sources
 
-                if (data_source in new_sources) is False:
-                    new_sources.append(data_source)
-        except ImportError:
-            pass
-        except AttributeError:
-            pass
+    return [source for source in data_sources if query in '\n'.join('%s' % field for field in source[:3]).lower()]
 
-    new_sources.sort(key=lambda source: '%s--%s' % (source[2], source[1]))
+@staff_member_required
+def simple_data_export_data_sources(request):
+    if request.GET.get('refresh', '') != '':
+        invalidate_data_source_catalog()
 
-    data_sources = []
+    data_sources = filter_data_sources(fetch_data_source_catalog(), request.GET.get('q', ''))
 
-    last_category = None
+    page_size = 100
 
-    for source in new_sources:
-        if source[2] != last_category:
-            data_sources.append((source[2],))
+    try:
+        page_size = min(max(int(request.GET.get('page_size', page_size)), 1), 1000)
+    except ValueError:
+        pass
 
-            last_category = source[2]
+    paginator = Paginator(data_sources, page_size)
 
-        data_sources.append(source)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
 
-    context['data_sources'] = data_sources
+    response = {
+        'count': page.paginator.count,
+        'page': page.number,
+        'pages': page.paginator.num_pages,
+        'sources': [],
+    }
 
-    context['data_types'] = []
+    for source in page.object_list:
+        response['sources'].append({
+            'identifier': source[0],
+            'name': source[1],
+            'category': source[2],
+        })
 
-    for app in settings.INSTALLED_APPS:
-        try:
-            export_api = importlib.import_module(app + '.simple_data_export_api')
+    return JsonResponse(response)
 
-            data_types = export_api.export_data_types()
+@staff_member_required
+def simple_data_export_form(request):
+    context = {}
 
-            for data_type in data_types:
-                if (data_type in context['data_types']) is False:
-                    context['data_types'].append(data_type)
-        except ImportError:
-            pass
-        except AttributeError:
-            pass
+    context['data_types'] = list(fetch_export_data_types())
 
     if request.method == 'POST':
         selected_sources = []
         selected_data_types = []
 
-        for source in context['data_sources']:
-            if ('source_' + source[0]) in request.POST: # pylint: disable=superfluous-parens
+        data_sources = fetch_data_source_catalog()
+
+        if 'select_all_sources' in request.POST:
+            data_sources = filter_data_sources(data_sources, request.POST.get('source_query', ''))
+
+        for source in data_sources:
+            if 'select_all_sources' in request.POST or ('source_' + source[0]) in request.POST: # pylint: disable=superfluous-parens
                 selected_sources.append(source[0])
 
         for data_type in context['data_types']: